@@ -3,8 +3,41 @@
 import os
 
 import click
+import numpy as np
 
-from c10_tools.common import FileProgress, C10
+from c10_tools.common import AsyncWriter, FileProgress, PacketCopier, \
+    map_packets, ms1553_offsets
+
+
+def set_bus(packet, bus):
+    """Return the bytes of 1553 PacketView "packet" with the bus bit of every
+    message set to "bus" (0 for A, 1 for B). The data checksum, if present, is
+    adjusted by the bytes that changed.
+    """
+
+    raw = np.frombuffer(bytearray(packet.data), dtype=np.uint8)
+
+    # The bus ID is bit 13 of the (little endian) block status word, which
+    # follows the 8 byte timestamp in each message header.
+    offsets = ms1553_offsets(packet) + 9
+    old = raw[offsets]
+    if bus:
+        raw[offsets] |= 0x20
+    else:
+        raw[offsets] &= 0xdf
+
+    if packet.data_checksum:
+        size = (0, 1, 2, 4)[packet.data_checksum]
+        start = 36 if packet.secondary_header else 24
+        delta = raw[offsets].astype(np.int64) - old
+        delta <<= ((offsets - start) % size) * 8
+        end = packet.packet_length
+        checksum = int.from_bytes(raw[end - size:end].tobytes(), 'little')
+        checksum = (checksum + int(delta.sum())) & ((1 << (size * 8)) - 1)
+        raw[end - size:end] = np.frombuffer(
+            checksum.to_bytes(size, 'little'), dtype=np.uint8)
+
+    return raw.tobytes()
 
 
 @click.command()
@@ -19,13 +52,14 @@ def allbus(src, dst, force=False, b=False):
         print('Destination file exists. Use --force to overwrite it.')
         raise SystemExit
 
-    with open(dst, 'wb') as out, \
-            FileProgress(src) as progress:
-        for packet in C10(src):
+    with AsyncWriter(dst) as out, \
+            FileProgress(src) as progress, \
+            PacketCopier(src, out) as copier:
+        for packet in map_packets(src):
             progress.update(packet.packet_length)
 
+            # Only 1553 packets need to be rewritten.
             if packet.data_type == 0x19:
-                for msg in packet:
-                    msg.bus = int(b)
-
-            out.write(bytes(packet))
\ No newline at end of file
+                copier.write(set_bus(packet, int(b)))
+            else:
+                copier.copy(packet.offset, packet.packet_length)
\ No newline at end of file
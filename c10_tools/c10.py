@@ -3,19 +3,20 @@ import click
 
 from c10_tools.allbus import allbus
 from c10_tools.capture import capture
+from c10_tools.common import PrefetchReader
 from c10_tools.copy import copy
 from c10_tools.dump import dump
+from c10_tools.extract import extract
 from c10_tools.find import find
 from c10_tools.from_pcap import frompcap
 from c10_tools.inspect import inspect
+from c10_tools.monitor import monitor
 from c10_tools.reindex import reindex
+from c10_tools.sidecar import Sidecar
 from c10_tools.stat import stat
+from c10_tools.streamcheck import streamcheck
 from c10_tools.timefix import timefix
-try:
-    import matplotlib
-    from c10_tools.streamcheck import streamcheck
-except ImportError:
-    streamcheck = None
+from c10_tools.verify import verify
 
 
 VERSION = '1.1.4'
@@ -23,24 +24,32 @@ VERSION = '1.1.4'
 @click.group()
 @click.option('-v', '--verbose', is_flag=True, help='Verbose output')
 @click.option('-q', '--quiet', is_flag=True, help='Minimal output')
+@click.option('--read-ahead', type=int, default=PrefetchReader.BUFFER_SIZE >> 20, show_default=True, help='Read-ahead block size in MB (0 to disable)')
+@click.option('--no-sidecar', is_flag=True, envvar='C10_NO_SIDECAR', help="Don't write .c10idx index files next to input files")
 @click.pass_context
-def cli(ctx, verbose=False, quiet=False):
+def cli(ctx, verbose=False, quiet=False,
+        read_ahead=PrefetchReader.BUFFER_SIZE >> 20, no_sidecar=False):
     ctx.ensure_object(dict)
     ctx.obj['verbose'] = verbose
     ctx.obj['quiet'] = quiet
+    PrefetchReader.BUFFER_SIZE = read_ahead << 20
+    if no_sidecar:
+        Sidecar.SAVE = False
 
 cli.add_command(allbus)
 cli.add_command(capture)
 cli.add_command(copy)
 cli.add_command(dump)
+cli.add_command(extract)
 cli.add_command(find)
 cli.add_command(frompcap)
 cli.add_command(inspect)
+cli.add_command(monitor)
 cli.add_command(reindex)
 cli.add_command(stat)
+cli.add_command(streamcheck)
 cli.add_command(timefix)
-if streamcheck:
-    cli.add_command(streamcheck)
+cli.add_command(verify)
 
 
 if __name__ == '__main__':
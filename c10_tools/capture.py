@@ -1,67 +1,97 @@
 
 from contextlib import suppress
+from urllib.parse import urlparse
 import os
+import queue
+import socket
+import threading
+import time
 
-from chapter10 import C10
 from chapter10.computer import ComputerF1
+from tqdm import tqdm
 import click
-import dpkt
 
-from c10_tools.common import FileProgress, fmt_number
+from c10_tools.common import AsyncWriter, FileProgress, fmt_number
+from c10_tools.pcap import PcapReader, parse_ports
+from c10_tools.stream import StreamParser, TransferDemux, udp_socket
+
+
+class UDPReceiver(threading.Thread):
+    """Receive datagrams from a (unicast or multicast) UDP socket on a
+    dedicated thread and queue them (with the sender's address) for a
+    writer. If the writer falls behind and the queue fills up, datagrams are
+    dropped and counted rather than blocking the socket. The queue holds
+    "queue_size" datagrams, so with the default of 4096 and maximum size
+    datagrams it can grow to about 256 MB.
+    """
+
+    RECV_SIZE = 65535
+    SOCKET_BUFFER = 16 * 1024 * 1024
+    QUEUE_SIZE = 4096
+
+    def __init__(self, host, port, queue_size=QUEUE_SIZE):
+        threading.Thread.__init__(self, daemon=True)
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.stopped = threading.Event()
+
+        self.sock = udp_socket(host, port, self.SOCKET_BUFFER)
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                data, addr = self.sock.recvfrom(self.RECV_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self.queue.put_nowait((data, addr))
+            except queue.Full:
+                self.dropped += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sock.close()
 
 
 class NetworkCapture:
     """Capture Chapter 10 from an ethernet sniff or PCAP."""
 
-    BUF_SIZE = 100000
+    WRITE_BUFFER = 4 * 1024 * 1024
+    duration, count, ports = None, None, None
+    queue_size = UDPReceiver.QUEUE_SIZE
 
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
-        self.buf = b''
+        self.parser = StreamParser()
+        self.transfer = TransferDemux()
         self.tmats_present = False
 
-
     def parse_bytes(self, data, out_file):
-        """Adds "data" to buffer and attempts to parse chapter 10 data.
-        Returns count of packets added.
+        """Adds "data" to the stream parser and writes out any complete
+        packets. Returns count of packets added.
         """
 
         packets_added = 0
+        for packet in self.parser.feed(data):
 
-        # Limit the buffer size and add new data to the buffer.
-        self.buf = self.buf[-self.BUF_SIZE:] + data
+            # Ignore data until TMATS is present.
+            if not self.tmats_present:
+                if packet.data_type == 1:
+                    self.tmats_present = True
+                else:
+                    continue
 
-        # Start each attempt from a sync pattern.
-        for i in range(self.buf.count(b'\x25\xeb')):
-            sync = self.buf.find(b'\x25\xeb')
-
-            # Needed in case our sync pattern isn't around anymore.
-            if sync < 0:
+            # Skip additional TMATS records
+            elif packet.data_type == 1:
                 continue
 
-            with suppress(RuntimeError, EOFError):
-                for packet in C10.from_string(self.buf[sync:]):
-
-                    # Ignore data until TMATS is present.
-                    if not self.tmats_present:
-                        if packet.data_type == 1:
-                            self.tmats_present = True
-                        else:
-                            continue
-
-                    # Skip additional TMATS records
-                    elif packet.data_type == 1:
-                        continue
-
-                    raw = bytes(packet)
-                    if len(raw) == packet.packet_length:
-                        packets_added += 1
-                        out_file.write(raw)
-
-                    # Only read one packet.
-                    break
-
-            self.buf = self.buf[sync + 2:]
+            packets_added += 1
+            out_file.write(packet.data)
 
         return packets_added
 
@@ -73,23 +103,57 @@ class NetworkCapture:
             if self.quiet:
                 progress.close()
 
-            for packet in dpkt.pcap.Reader(f):
-                ip = dpkt.ethernet.Ethernet(packet[1]).data
-                if hasattr(ip, 'data') and isinstance(
-                        ip.data, dpkt.udp.UDP):
-                    data = ip.data.data[4:]
-                    network_packets += 1
+            reader = PcapReader(f, self.ports)
+            for _, src, dst, datagram in reader:
+                network_packets += 1
+                for data, _ in self.transfer.feed(datagram,
+                                                  source=(src, dst)):
                     c10_packets += self.parse_bytes(data, outfile)
 
                 # Update progress bar.
-                progress.update_from_tell(f.tell())
+                progress.update_from_tell(reader.tell())
+
+        for data, _ in self.transfer.flush():
+            c10_packets += self.parse_bytes(data, outfile)
+
+        return network_packets, c10_packets
+
+    def capture_udp(self, receiver, outfile, duration=None, count=None):
+        """Write Chapter 10 from datagrams queued by a running UDPReceiver
+        until interrupted, "duration" seconds pass, or "count" packets have
+        been written.
+        """
+
+        network_packets, c10_packets = 0, 0
+        deadline = duration and time.monotonic() + duration
+        with tqdm(unit='packets', disable=self.quiet) as progress, \
+                suppress(KeyboardInterrupt):
+            while not deadline or time.monotonic() < deadline:
+                # Stop waiting for out-of-order datagrams when the stream
+                # goes quiet.
+                try:
+                    datagram, addr = receiver.queue.get(timeout=0.1)
+                    network_packets += 1
+                    ready = self.transfer.feed(datagram, source=addr)
+                except queue.Empty:
+                    ready = self.transfer.flush()
+                for data, _ in ready:
+                    added = self.parse_bytes(data, outfile)
+                    c10_packets += added
+                    progress.update(added)
+                if count and c10_packets >= count:
+                    break
+
+        if not count or c10_packets < count:
+            for data, _ in self.transfer.flush():
+                c10_packets += self.parse_bytes(data, outfile)
 
         return network_packets, c10_packets
 
     def main(self):
-        """Parse a pcap file into chapter 10 format."""
+        """Parse a pcap file or live UDP stream into chapter 10 format."""
 
-        with open(self.outfile, 'wb') as out:
+        with AsyncWriter(self.outfile, self.WRITE_BUFFER) as out:
 
             # Write TMATS if needed.
             if self.tmats:
@@ -100,12 +164,30 @@ class NetworkCapture:
                 self.tmats_present = True
 
             # Parse data.
-            network_packets, c10_packets = self.parse_pcap(
-                self.infile, out)
+            if self.infile.startswith('udp://'):
+                address = urlparse(self.infile)
+                receiver = UDPReceiver(address.hostname, address.port,
+                                       self.queue_size)
+                receiver.start()
+                try:
+                    network_packets, c10_packets = self.capture_udp(
+                        receiver, out, self.duration, self.count)
+                finally:
+                    receiver.stop()
+                if receiver.dropped:
+                    print('Dropped %s network packets'
+                          % fmt_number(receiver.dropped))
+            else:
+                network_packets, c10_packets = self.parse_pcap(
+                    self.infile, out)
 
             # if not self.args['-q']:
             print('Parsed %s Chapter 10 packets from %s network packets'
                   % (fmt_number(c10_packets), fmt_number(network_packets)))
+            if self.transfer.lost or self.transfer.incomplete:
+                print('Missing %s network packets (%s incomplete Chapter 10 '
+                      'packets)' % (fmt_number(self.transfer.lost),
+                                    fmt_number(self.transfer.incomplete)))
 
 
 @click.command()
@@ -113,9 +195,16 @@ class NetworkCapture:
 @click.argument('outfile')
 @click.option('-f', '--force', default=False, is_flag=True, help='Overwrite existing output file.')
 @click.option('-t', '--tmats', help='Specify an existing TMATS file to insert at the beginning of the output file')
+@click.option('-d', '--duration', type=float, help='Stop live capture after this many seconds')
+@click.option('-n', '--count', type=int, help='Stop live capture after this many Chapter 10 packets')
+@click.option('-p', '--port', type=str, help='Only read UDP ports (comma-separated) from a pcap file')
+@click.option('--queue-size', type=click.IntRange(1), default=UDPReceiver.QUEUE_SIZE, show_default=True, help='Datagrams to buffer during live capture before dropping')
 @click.pass_context
-def capture(ctx, infile, outfile, force=False, tmats=None):
-    """Capture chapter 10 data from a pcap file."""
+def capture(ctx, infile, outfile, force=False, tmats=None, duration=None,
+            count=None, port=None, queue_size=UDPReceiver.QUEUE_SIZE):
+    """Capture chapter 10 data from a pcap file or a live UDP stream given as
+    udp://[host]:port (host may be a multicast group).
+    """
 
     ctx.ensure_object(dict)
     if os.path.exists(outfile) and not force:
@@ -126,6 +215,10 @@ def capture(ctx, infile, outfile, force=False, tmats=None):
                             outfile=outfile,
                             force=force,
                             tmats=tmats,
+                            duration=duration,
+                            count=count,
+                            ports=parse_ports(port),
+                            queue_size=queue_size,
                             verbose=ctx.obj.get('verbose'),
                             quiet=ctx.obj.get('quiet'))
     parser.main()
@@ -1,19 +1,31 @@
 
+from contextlib import suppress
 from datetime import timedelta, datetime
+from io import BytesIO
+import mmap
 import os
+import queue
 import struct
+import sys
+import threading
 
 from tqdm import tqdm
-from chapter10 import C10
+import numpy as np
+from chapter10 import C10, InvalidPacket
+from chapter10.c10 import TYPES
+from chapter10.util import Buffer
 
 
 # Format a number nicely with commas for thousands, etc.
 fmt_number = '{0:,}'.format
 
 
-def as_hex(bytes):
-    from array import array
-    return ' '.join(hex(b)[2:].zfill(2) for b in array('B', bytes))
+def as_hex(data):
+    """Format bytes as space-separated hex pairs."""
+
+    if sys.version_info >= (3, 8):
+        return bytes(data).hex(' ')
+    return ' '.join('%02x' % b for b in bytearray(data))
 
 
 def swap_word(word):
@@ -80,11 +92,22 @@ def get_time(rtc, time_packet):
     if time_packet is None:
         return datetime.now()
 
-    rtc -= time_packet.rtc
+    return time_packet.time + timedelta(
+        seconds=rtc_seconds(rtc, time_packet.rtc))
+
+
+def rtc_seconds(rtc, start):
+    """Return seconds from RTC "start" to "rtc", wrapping the difference at
+    48 bits as pychapter10's get_time() does.
+    """
+
+    rtc = int(rtc) - int(start)
     mask = 0xffffffffffff
-    while rtc > mask:
-        rtc -= mask
-    return time_packet.time + timedelta(seconds=rtc / 10_000_000)
+
+    # Same as repeatedly subtracting "mask" while rtc > mask.
+    if rtc > mask:
+        rtc -= (rtc - 1) // mask * mask
+    return rtc / 10_000_000
 
 
 def fmt_size(size):
@@ -97,8 +120,721 @@ def fmt_size(size):
     return '{} {}'.format(round(size, 2), unit)
 
 
-def walk_packets(c10, args={}, include_time=True):
-    """Walk a chapter 10 file based on sys.argv (type, channel, etc.)."""
+class Header:
+    """Primary header values for a single packet, read without touching the
+    packet body.
+    """
+
+    FORMAT = struct.Struct('<HHIIBBBBIHH')
+    WORDS = struct.Struct('<11H')
+
+    __slots__ = ('offset', 'sync_pattern', 'channel_id', 'packet_length',
+                 'data_length', 'header_version', 'sequence_number', 'flags',
+                 'data_type', 'rtc', 'header_checksum', 'raw')
+
+    def __init__(self, raw, offset=0):
+        (self.sync_pattern, self.channel_id, self.packet_length,
+         self.data_length, self.header_version, self.sequence_number,
+         self.flags, self.data_type, rtc_low, rtc_high,
+         self.header_checksum) = self.FORMAT.unpack_from(raw)
+        self.rtc = (rtc_high << 32) | rtc_low
+        self.offset = offset
+        self.raw = raw
+
+    @property
+    def secondary_header(self):
+        return bool(self.flags & 0x80)
+
+    @property
+    def data_checksum(self):
+        return self.flags & 0x3
+
+    def validate(self, silent=False):
+        """Check sync pattern, header checksum, and lengths. If silent = False
+        raises InvalidPacket.
+        """
+
+        err = None
+        if self.sync_pattern != 0xeb25:
+            err = InvalidPacket('Incorrect sync pattern!')
+        elif sum(self.WORDS.unpack_from(self.raw)) & 0xffff != \
+                self.header_checksum:
+            err = InvalidPacket('Header checksum mismatch!')
+        elif self.data_length > 524288:
+            err = InvalidPacket(
+                f'Data length {self.data_length} larger than allowed!')
+        elif self.packet_length < self.data_length + 24:
+            err = InvalidPacket('Packet length incorrect')
+
+        if err:
+            if not silent:
+                raise err
+            return False
+        return True
+
+    def __repr__(self):
+        return f'<Header {self.data_type:#04x} {self.packet_length} bytes>'
+
+
+class PacketView(Header):
+    """A Header plus a zero-copy memoryview ("data") of the whole packet, as
+    yielded by map_packets(). Writing "data" out passes the packet through
+    without decoding or re-encoding it.
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, view, offset=0):
+        Header.__init__(self, view[offset:offset + 24], offset)
+        self.data = view[offset:offset + self.packet_length]
+
+    @property
+    def body(self):
+        """Everything after the primary (and secondary) header."""
+
+        return self.data[36 if self.secondary_header else 24:]
+
+    def __bytes__(self):
+        return bytes(self.data)
+
+    def checksum_valid(self):
+        """Check the data checksum (if any) at the end of the packet."""
+
+        size = (0, 1, 2, 4)[self.data_checksum]
+        if not size:
+            return True
+        body = self.body
+        if len(body) < size:
+            return False
+        end = (len(body) - size) // size * size
+        words = np.frombuffer(body[:end], dtype=f'<u{size}')
+        total = int(words.sum(dtype=np.uint64)) & ((1 << size * 8) - 1)
+        return total == int.from_bytes(body[-size:], 'little')
+
+    def decode(self, parent=None):
+        """Parse the packet with pychapter10. "parent" is passed on to the
+        packet for get_time().
+        """
+
+        return read_packet(BytesIO(self.data), Header(self.raw), parent)
+
+
+def map_packets(path):
+    """Memory-map a local file and yield a PacketView for each packet.
+    Corrupt headers are skipped by resyncing to the next sync pattern and a
+    final truncated packet is ignored. The mapping is released once the last
+    view into it is gone.
+    """
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, 'madvise'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+    view = memoryview(mapped)
+    offset = 0
+    while offset + 24 <= size:
+        packet = PacketView(view, offset)
+        if not packet.validate(True):
+            offset = mapped.find(b'\x25\xeb', offset + 1)
+            if offset < 0:
+                return
+            continue
+        if offset + packet.packet_length > size:
+            return
+        yield packet
+        offset += packet.packet_length
+
+
+def ms1553_offsets(packet):
+    """Return a NumPy array of the offsets (into packet.data) of each
+    message's 14 byte intra-packet header in a 1553 format 1 PacketView.
+    Message data follows each header. Stops at the first message that would
+    run past the end of the packet body.
+    """
+
+    data = packet.data
+    pos = 36 if packet.secondary_header else 24
+    end = pos + packet.data_length
+    count = int.from_bytes(data[pos:pos + 3], 'little')
+    pos += 4
+
+    offsets = []
+    unpack = struct.Struct('<H').unpack_from
+    while len(offsets) < count and pos + 14 <= end:
+        length, = unpack(data, pos + 12)
+        if pos + 14 + length > end:
+            break
+        offsets.append(pos)
+        pos += 14 + length + (length & 1)
+    return np.array(offsets, dtype=np.int64)
+
+
+def gather(raw, offsets, dtype):
+    """Read a little endian "dtype" value at each of "offsets" in "raw" (a
+    uint8 array).
+    """
+
+    size = np.dtype(dtype).itemsize
+    return raw[offsets[:, None] + np.arange(size)].view(dtype).ravel()
+
+
+class AsyncWriter:
+    """Binary output file that collects writes into large buffers and hands
+    them to a background thread, so parsing can carry on while the disk
+    catches up. At most "depth" full buffers are queued before write()
+    blocks. An error in the writer thread is raised by the next full
+    write(), flush(), or close(), and anything written after it is
+    discarded.
+    """
+
+    BUFFER_SIZE = 1 << 22
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE, depth=2):
+        self.name = path
+
+        # O_BINARY keeps Windows from translating newlines.
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                          getattr(os, 'O_BINARY', 0), 0o666)
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.position = 0
+        self.error = None
+        self.closed = False
+        self.queue = queue.Queue(depth)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def run(self):
+        """Write queued buffers until given None."""
+
+        while True:
+            buf = self.queue.get()
+            try:
+                if buf is None:
+                    break
+                if self.error is None:
+                    view = memoryview(buf)
+                    while view:
+                        view = view[os.write(self.fd, view):]
+            except OSError as err:
+                self.error = err
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        if len(self.buffer) >= self.buffer_size:
+            self.check()
+            self.queue.put(self.buffer)
+            self.buffer = bytearray()
+        return len(data)
+
+    def flush(self):
+        """Wait until everything written so far is on its way to the OS."""
+
+        if self.buffer:
+            self.queue.put(self.buffer)
+            self.buffer = bytearray()
+        self.queue.join()
+        self.check()
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.flush()
+        self.position = os.lseek(self.fd, offset, whence)
+        return self.position
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            # Anything after an error has already been lost.
+            if self.error is None:
+                self.flush()
+            self.check()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            os.close(self.fd)
+
+
+class PrefetchReader:
+    """Read-only binary file that reads ahead in large blocks on a
+    background thread, so sequential scans don't wait on small reads. Seeks
+    within the blocks already fetched (or about to be) are free; anything
+    else restarts the read-ahead from the new position. Set BUFFER_SIZE to
+    0 to have open_reader() return plain files instead.
+    """
+
+    BUFFER_SIZE = 1 << 23
+
+    def __init__(self, path, buffer_size=None, depth=2):
+        self.name = path
+        self.file = open(path, 'rb')
+        self.buffer_size = buffer_size or self.BUFFER_SIZE
+        self.depth = depth
+        self.pos = 0
+        self.block_start, self.block = 0, b''
+        self.thread = None
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self.file.fileno(), 0, 0,
+                             os.POSIX_FADV_SEQUENTIAL)
+        self.start(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self, index):
+        """(Re)start reading ahead from block "index"."""
+
+        self.stop()
+        self.next_index, self.end_index = index, None
+        self.queue = queue.Queue(self.depth)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, args=(index, self.queue, self.stopping),
+            daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopping.set()
+        with suppress(queue.Empty):
+            while True:
+                self.queue.get_nowait()
+        self.thread.join()
+        self.thread = None
+
+    def run(self, index, blocks, stopping):
+        """Read consecutive blocks into "blocks" until EOF or stopped."""
+
+        fd = self.file.fileno()
+        while not stopping.is_set():
+            offset = index * self.buffer_size
+            try:
+                self.file.seek(offset)
+                data = self.file.read(self.buffer_size)
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fd, offset + self.buffer_size,
+                                     self.buffer_size, os.POSIX_FADV_WILLNEED)
+            except OSError as err:
+                data = err
+            while not stopping.is_set():
+                with suppress(queue.Full):
+                    blocks.put((index, data), timeout=0.1)
+                    break
+            if not data or isinstance(data, OSError):
+                return
+            index += 1
+
+    def load(self, index):
+        """Make block "index" the current block."""
+
+        if self.end_index is not None and index >= self.end_index:
+            self.block_start, self.block = index * self.buffer_size, b''
+            return
+        if not self.next_index <= index <= self.next_index + self.depth:
+            self.start(index)
+        while True:
+            i, data = self.queue.get()
+            self.next_index = i + 1
+            if isinstance(data, OSError):
+                self.start(index)
+                raise data
+            if not data:
+                self.end_index = i
+            if i == index or not data:
+                self.block_start, self.block = index * self.buffer_size, data
+                return
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+        chunks = []
+        while size > 0:
+            offset = self.pos - self.block_start
+            if not 0 <= offset < len(self.block):
+                self.load(self.pos // self.buffer_size)
+                offset = self.pos - self.block_start
+                if offset >= len(self.block):
+                    break
+            chunk = self.block[offset:offset + min(
+                size, len(self.block) - offset)]
+            chunks.append(chunk)
+            self.pos += len(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += os.fstat(self.file.fileno()).st_size
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.stop()
+        self.file.close()
+
+
+def open_reader(path):
+    """Open a local file for reading, with read-ahead unless
+    PrefetchReader.BUFFER_SIZE is 0.
+    """
+
+    if PrefetchReader.BUFFER_SIZE:
+        return PrefetchReader(path)
+    return open(path, 'rb')
+
+
+class PacketCopier:
+    """Write packets from local file "src" to file object "out". Unmodified
+    packets are passed through as raw bytes with copy(), and runs of
+    consecutive packets are copied file-to-file in the kernel with
+    os.copy_file_range where it's available. Use write() for anything that
+    was changed.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, src, out):
+        self.src = open(src, 'rb')
+        self.out = out
+        self.start = self.end = None
+        self.kernel_copy = hasattr(os, 'copy_file_range')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def copy(self, offset, length):
+        """Pass through "length" bytes of the source file from "offset"."""
+
+        if self.end != offset:
+            self.flush()
+            self.start = offset
+        self.end = offset + length
+
+    def write(self, data):
+        """Write (modified) packet bytes."""
+
+        self.flush()
+        self.out.write(data)
+
+    def tell(self):
+        """Output offset, including any run that hasn't been copied yet."""
+
+        if self.start is None:
+            return self.out.tell()
+        return self.out.tell() + self.end - self.start
+
+    def flush(self):
+        """Copy any pending run of source bytes to the output."""
+
+        if self.start is None:
+            return
+        start, end = self.start, self.end
+        self.start = self.end = None
+
+        if self.kernel_copy:
+            try:
+                self.out.flush()
+                fd = self.out.fileno()
+            except (OSError, ValueError):
+                self.kernel_copy = False
+
+        if self.kernel_copy:
+            try:
+                while start < end:
+                    copied = os.copy_file_range(
+                        self.src.fileno(), fd, end - start, start)
+                    if not copied:
+                        break
+                    start += copied
+            except OSError:
+                self.kernel_copy = False
+
+            # Bring the buffered writer's position up to date.
+            self.out.seek(os.lseek(fd, 0, os.SEEK_CUR))
+
+        # Fall back to reading and writing.
+        self.src.seek(start)
+        while start < end:
+            chunk = self.src.read(min(end - start, self.CHUNK_SIZE))
+            if not chunk:
+                break
+            self.out.write(chunk)
+            start += len(chunk)
+
+    def close(self):
+        self.flush()
+        self.src.close()
+
+
+def find_sync(f, chunk_size=100000):
+    """Seek forward in a file to the next sync pattern (eb25) and return the
+    new offset. Raises EOFError if none is found.
+    """
+
+    while True:
+        offset = f.tell()
+        buffer = f.read(chunk_size)
+        if len(buffer) < 2:
+            raise EOFError
+        sync = buffer.find(b'\x25\xeb')
+        if sync >= 0:
+            f.seek(offset + sync)
+            return offset + sync
+
+        # Back up one byte in case the pattern straddles chunks.
+        f.seek(offset + len(buffer) - 1)
+
+
+def walk_headers(f, size=None, on_error=None):
+    """Yield a Header for each packet in file-like "f" from the current
+    position, seeking past packet bodies instead of reading them. Corrupt
+    headers are skipped by resyncing to the next sync pattern. If "size" is
+    given, a final packet truncated by the end of the file is ignored. If
+    "on_error" is given it's called with (offset, message) for each corrupt
+    header where a packet was expected and for a truncated final packet.
+    """
+
+    resyncing = False
+    while True:
+        offset = f.tell()
+        raw = f.read(24)
+        if len(raw) < 24:
+            return
+
+        header = Header(raw, offset)
+        if not header.validate(True):
+            if on_error is not None and not resyncing:
+                try:
+                    header.validate()
+                except InvalidPacket as err:
+                    on_error(offset, str(err))
+            resyncing = True
+            f.seek(offset + 1)
+            try:
+                find_sync(f)
+            except EOFError:
+                return
+            continue
+
+        resyncing = False
+        end = offset + header.packet_length
+        if size is not None and end > size:
+            if on_error is not None:
+                on_error(offset, 'Packet truncated by end of file')
+            return
+
+        yield header
+
+        # Seek absolutely in case the caller read from "f" in the meantime.
+        f.seek(end)
+
+
+def split_file(size, jobs):
+    """Split "size" bytes into up to "jobs" contiguous (start, end) ranges."""
+
+    step = max(-(-size // jobs), 1)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def sync_range(f, start, end, size):
+    """Seek to the first packet in "f" that starts within [start, end) and
+    return its offset, or None if there isn't one. A sync pattern only counts
+    if its header and the one following it (or EOF) are both valid, so
+    chunks scanned in parallel line up with where a sequential scan would
+    have been.
+    """
+
+    f.seek(start)
+    while True:
+        try:
+            offset = find_sync(f)
+        except EOFError:
+            return None
+        if offset >= end:
+            return None
+
+        raw = f.read(24)
+        if len(raw) < 24:
+            return None
+        header = Header(raw, offset)
+        if header.validate(True):
+            next_offset = offset + header.packet_length
+            if next_offset == size:
+                break
+            elif next_offset < size:
+                f.seek(next_offset)
+                raw = f.read(24)
+                if len(raw) == 24 and Header(raw).validate(True):
+                    break
+
+        f.seek(offset + 1)
+
+    f.seek(offset)
+    return offset
+
+
+def walk_range(f, start, end, size, on_error=None):
+    """Yield headers (as walk_headers) for packets starting within
+    [start, end). Errors past "end" are left for the next range.
+    """
+
+    if sync_range(f, start, end, size) is None:
+        return
+    if on_error is not None:
+        report = on_error
+
+        def on_error(offset, message):
+            if offset < end:
+                report(offset, message)
+
+    for header in walk_headers(f, size, on_error):
+        if header.offset >= end:
+            return
+        yield header
+
+
+def read_range(c10, end):
+    """Yield packets from a C10 object until one starts at or after "end"."""
+
+    while c10.file.tell() < end:
+        try:
+            packet = next(c10)
+        except StopIteration:
+            return
+        if c10.file.tell() - packet.packet_length >= end:
+            return
+        yield packet
+
+
+class TimeRef:
+    """Picklable copy of the parts of a time packet needed to compute
+    timestamps, for passing results between processes.
+    """
+
+    __slots__ = ('time', 'rtc', 'date_format')
+
+    def __init__(self, packet):
+        self.time = packet.time
+        self.rtc = packet.rtc
+        self.date_format = packet.date_format
+
+    def get_time(self, rtc):
+        """Return a timestamp for "rtc" as Packet.get_time() would."""
+
+        return self.time + timedelta(seconds=rtc_seconds(rtc, self.rtc))
+
+
+def read_packet(f, header, parent=None):
+    """Decode the full packet at "header" with pychapter10. "parent" is passed
+    on to the packet for get_time().
+    """
+
+    handler = TYPES.get(header.data_type)
+    if handler is None:
+        raise NotImplementedError(
+            'Type %s not implemented' % hex(header.data_type))
+    f.seek(header.offset)
+    return handler(Buffer(f), parent=parent)
+
+
+def read_index(f, size):
+    """Follow the root index chain back from the end of a file and return a
+    list of (offset, channel_id, data_type, ipts) node index entries sorted by
+    offset, or None if the file doesn't end with a root index packet.
+    """
+
+    # The root index packet should be the last packet in the file, so look
+    # for a valid header that ends exactly at EOF.
+    tail = min(size, 524288 + 64)
+    f.seek(size - tail)
+    buf = f.read(tail)
+    sync = len(buf)
+    while True:
+        sync = buf.rfind(b'\x25\xeb', 0, sync)
+        if sync < 0 or len(buf) - sync < 24:
+            if sync < 0:
+                return None
+            continue
+        header = Header(buf[sync:sync + 24], size - tail + sync)
+        if header.data_type == 0x03 and header.validate(True) and \
+                header.offset + header.packet_length == size:
+            break
+
+    entries, seen = [], set()
+    while header.offset not in seen:
+        seen.add(header.offset)
+        root = read_packet(f, header)
+        if root.index_type != 0:
+            break
+
+        # Read messages right away; pychapter10 shares the message format
+        # between root and node packets.
+        for node in list(root):
+            f.seek(node.offset)
+            node_header = Header(f.read(24), node.offset)
+            if node_header.data_type != 0x03 or \
+                    not node_header.validate(True):
+                continue
+            node = read_packet(f, node_header)
+            entries += [(entry.offset, entry.channel_id, entry.data_type,
+                         entry.ipts) for entry in node]
+
+        # Previous root index packet (the first points to itself). Read the
+        # offset from the end of the body directly.
+        f.seek(header.offset + (36 if header.secondary_header else 24) +
+               header.data_length - 8)
+        root_offset, = struct.unpack('<Q', f.read(8))
+        f.seek(root_offset)
+        header = Header(f.read(24), root_offset)
+        if header.data_type != 0x03 or not header.validate(True):
+            break
+
+    return sorted(entries) or None
+
+
+def parse_filters(args):
+    """Parse channel, exclude, and type selections from args. Returns lists
+    of channel strings, excluded channel strings, and integer types.
+    """
 
     # Apply defaults.
     args['--type'] = args.get('--type') or ''
@@ -113,6 +849,26 @@ def walk_packets(c10, args={}, include_time=True):
     channels = [c.strip() for c in args['--channel'].split(',') if c.strip()]
     exclude = [e.strip() for e in args['--exclude'].split(',') if e.strip()]
 
+    return channels, exclude, types
+
+
+def walk_packets(c10, args={}, include_time=True, sidecar=False):
+    """Walk a chapter 10 file based on sys.argv (type, channel, etc.). "c10"
+    may yield full packets or Header objects. If "sidecar" is set and "c10"
+    is a C10 object reading a local file, use a sidecar index to seek
+    straight to the selected packets.
+    """
+
+    channels, exclude, types = parse_filters(args)
+
+    if sidecar and (channels or exclude or types):
+        from c10_tools.sidecar import Sidecar
+
+        index = Sidecar.from_c10(c10)
+        if index is not None:
+            yield from index.walk(c10, channels, exclude, types, include_time)
+            return
+
     # Filter packets (except time).
     for i, packet in enumerate(c10):
         if include_time and packet.data_type == 0x11:
@@ -129,6 +885,65 @@ def walk_packets(c10, args={}, include_time=True):
         yield packet
 
 
+class OutputBuffer:
+    """Collect lines of text output and write them to stdout in large
+    batches instead of line by line. If "progress" (a FileProgress) is
+    given it's cleared around each write and only then moved on to
+    "position" (set by move()), so progress updates are as coarse as the
+    batches.
+    """
+
+    BATCH_SIZE = 1 << 20
+    PROGRESS_STEP = 1 << 24
+
+    def __init__(self, progress=None, batch_size=BATCH_SIZE):
+        self.progress = progress
+        self.batch_size = batch_size
+        self.lines, self.length = [], 0
+        self.position = 0
+
+    def write(self, line):
+        """Queue a line (without its newline)."""
+
+        self.lines.append(line)
+        self.length += len(line) + 1
+        if self.length >= self.batch_size:
+            self.flush()
+
+    def move(self, position):
+        """Note how far through the input we are, flushing early if there
+        hasn't been a batch for a while (when most input is filtered out).
+        """
+
+        self.position = position
+        if self.progress is not None and \
+                position - self.progress.last_tell >= self.PROGRESS_STEP:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            text = '\n'.join(self.lines)
+            self.lines, self.length = [], 0
+            if self.progress is None:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            else:
+                with self.progress.external_write_mode(file=sys.stdout):
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+        if self.progress is not None:
+            self.progress.update_from_tell(self.position)
+
+    def close(self):
+        """Clear the progress bar and write out anything left."""
+
+        if self.progress is not None:
+            self.progress.close()
+            self.progress = None
+        self.flush()
+
+
 class FileProgress(tqdm):
     """Extend tqdm to show progress reading over a file based on f.tell()."""
 
@@ -1,11 +1,14 @@
 
+from bisect import bisect_right
 from datetime import datetime, timedelta
 import os
 
 import click
 
 from chapter10.computer import ComputerF1
-from c10_tools.common import walk_packets, FileProgress, C10
+from c10_tools.common import AsyncWriter, walk_packets, FileProgress, C10, \
+    PacketCopier, read_index
+from c10_tools.sidecar import Sidecar
 
 
 def parse_offset(s):
@@ -34,6 +37,31 @@ def parse_offset(s):
                          microseconds=dt.microsecond)
 
 
+def index_seek(index, start, time_packet=None):
+    """Use node index entries to find a place to jump to. For a byte offset
+    "start" that's the last indexed packet at or before it. For a datetime
+    it's the last indexed time packet at or before it, comparing IPTS against
+    an RTC derived from "time_packet". Returns None if there's no match.
+    """
+
+    if isinstance(start, int):
+        offsets = [offset for offset, _, _, _ in index]
+        i = bisect_right(offsets, start) - 1
+
+    else:
+        rtc = time_packet.rtc + int(
+            (start - time_packet.time).total_seconds() * 10_000_000)
+        offsets, ipts = [], []
+        for offset, _, data_type, entry_ipts in index:
+            if data_type == 0x11:
+                offsets.append(offset)
+                ipts.append(entry_ipts)
+        i = bisect_right(ipts, rtc) - 1
+
+    if i >= 0:
+        return offsets[i]
+
+
 @click.command()
 @click.option('-c', '--channel', type=str, help='Specify channels (comma-separated) to include')
 @click.option('-e', '--exclude', type=str, help='Specify channels (comma-separated) to exclude')
@@ -75,7 +103,23 @@ def copy(ctx, src, dst, start, end, channel=None, exclude=None, type=None, force
     file_start_time = None
     slice_start = None
 
-    with open(dst, 'wb') as out, FileProgress(src) as progress:
+    with AsyncWriter(dst) as out, FileProgress(src) as progress, \
+            PacketCopier(src, out) as copier:
+        c10 = C10(src)
+
+        # Check for index packets (or a sidecar index) we can use to skip
+        # ahead. Offsets only line up with the index when we're not
+        # filtering.
+        index = None
+        if start and not (type or channel or exclude):
+            index = read_index(c10.file.io, os.stat(src).st_size)
+            c10.file.seek(0)
+            if index is None:
+                sidecar = Sidecar.load(src)
+                index = list(zip(sidecar.offset.tolist(),
+                                 sidecar.channel_id.tolist(),
+                                 sidecar.data_type.tolist(),
+                                 sidecar.rtc.tolist()))
 
         # Iterate over packets based on args.
         offset = 0
@@ -84,8 +128,9 @@ def copy(ctx, src, dst, start, end, channel=None, exclude=None, type=None, force
             '--channel': channel,
             '--exclude': exclude,
         }
-        for packet in walk_packets(C10(src), args, include_time=False):
-            progress.update(packet.packet_length)
+        for packet in walk_packets(c10, args, include_time=False,
+                                   sidecar=True):
+            progress.update_from_tell(c10.file.tell())
 
             # First time packet
             if not file_start_time and packet.data_type == 0x11:
@@ -105,6 +150,14 @@ def copy(ctx, src, dst, start, end, channel=None, exclude=None, type=None, force
                 elif isinstance(end, datetime):
                     end = end.replace(year=packet.time.year)
 
+                # Jump ahead toward start if indexed.
+                if index and start:
+                    target = index_seek(index, start, packet)
+                    if target and target > offset:
+                        c10.file.seek(target)
+                        offset = target
+                        continue
+
             # Can't check time until we find a time packet. Preserve TMATS
             if start and not file_start_time and not isinstance(packet, ComputerF1):
                 pass
@@ -133,7 +186,8 @@ def copy(ctx, src, dst, start, end, channel=None, exclude=None, type=None, force
                     if isinstance(end, int):
                         end += slice_start
 
-                # Copy packet to new file.
-                out.write(bytes(packet))
+                # Copy raw packet bytes to new file.
+                copier.copy(c10.file.tell() - packet.packet_length,
+                            packet.packet_length)
 
             offset += packet.packet_length
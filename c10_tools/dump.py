@@ -10,7 +10,8 @@ from dpkt.pcap import Writer
 from dpkt.udp import UDP
 import click
 
-from c10_tools.common import FileProgress, C10, get_time
+from c10_tools.common import FileProgress, C10, OutputBuffer, as_hex, \
+    get_time, walk_packets
 
 
 @click.command()
@@ -35,9 +36,13 @@ def dump(ctx, infile, channel, count, byteoffset, pcap, bin):
     if pcap:
         writer = Writer(sys.stdout.buffer)
 
-    for packet in C10(infile):
-        if progress:
-            progress.update(packet.packet_length)
+    # Text (hex dump and TMATS) is written out in batches.
+    output = OutputBuffer(progress)
+
+    c10 = C10(infile)
+    for packet in walk_packets(c10, {'--channel': str(channel)},
+                               sidecar=True):
+        output.move(c10.file.tell())
 
         if packet.data_type == 0x11:
             last_time = packet
@@ -46,7 +51,11 @@ def dump(ctx, infile, channel, count, byteoffset, pcap, bin):
             continue
 
         if packet.data_type == 1:
-            print(packet.data.decode())
+            output.write(packet.data.decode())
+
+            # Keep TMATS ahead of any binary output.
+            if bin or pcap:
+                output.flush()
 
         for msg in packet:
             msg_time = get_time(getattr(msg, 'ipts', packet.rtc), last_time)
@@ -94,4 +103,9 @@ def dump(ctx, infile, channel, count, byteoffset, pcap, bin):
             # Hex dump
             else:
                 data_bytes = msg.data[byteoffset:count]
-                print(' '.join([str(msg_time)] + [f'{b:02x}'.zfill(2) for b in data_bytes]))
+                if data_bytes:
+                    output.write(f'{msg_time} {as_hex(data_bytes)}')
+                else:
+                    output.write(str(msg_time))
+
+    output.close()
@@ -0,0 +1,268 @@
+
+import mmap
+import os
+import struct
+import tempfile
+import zipfile
+
+import click
+import numpy as np
+
+from c10_tools.common import FileProgress, PacketView, fmt_number, gather, \
+    ms1553_offsets, parse_filters
+from c10_tools.sidecar import Sidecar
+
+
+# Longest possible 1553 message (RT to RT with 32 data words).
+MAX_WORDS = 36
+
+# Name, dtype, and shape of each column.
+COLUMNS = (
+    ('channel_id', '<u2'),
+    ('time', '<f8'),
+    ('ipts', '<u8'),
+    ('status', '<u2'),
+    ('gap', '<u2'),
+    ('length', '<u2'),
+    ('command', '<u2'),
+    ('words', '<u2', (MAX_WORDS,)),
+    ('le', '?'),
+    ('se', '?'),
+    ('we', '?'),
+    ('timeout', '?'),
+    ('fe', '?'),
+    ('rt2rt', '?'),
+    ('me', '?'),
+    ('bus', '?'),
+)
+DTYPE = np.dtype(list(COLUMNS))
+
+# Flags in the block status word.
+FLAGS = (
+    ('le', 0x20),
+    ('se', 0x10),
+    ('we', 0x08),
+    ('timeout', 0x200),
+    ('fe', 0x400),
+    ('rt2rt', 0x800),
+    ('me', 0x1000),
+    ('bus', 0x2000),
+)
+
+
+def read_messages(packet, time=np.nan):
+    """Return a dict of columns (see COLUMNS) for the messages in 1553
+    format 1 PacketView "packet". "time" is the absolute time of the packet
+    in seconds since the epoch (from a sidecar index).
+    """
+
+    raw = np.frombuffer(packet.data, dtype=np.uint8)
+    offsets = ms1553_offsets(packet)
+
+    ipts = gather(raw, offsets, '<u8')
+    status = gather(raw, offsets + 8, '<u2')
+    length = gather(raw, offsets + 12, '<u2')
+
+    # Data words, zero-filled past the end of each message.
+    valid = np.arange(MAX_WORDS) < np.minimum(length // 2, MAX_WORDS)[:, None]
+    index = np.where(
+        valid, offsets[:, None] + 14 + np.arange(0, MAX_WORDS * 2, 2), 0)
+    words = raw[index] | (raw[index + 1].astype(np.uint16) << 8)
+    words[~valid] = 0
+
+    # Signed 48-bit RTC difference from the packet header.
+    delta = (ipts.astype(np.int64) - packet.rtc) & 0xffffffffffff
+    delta[delta >= 1 << 47] -= 1 << 48
+
+    columns = {
+        'channel_id': np.full(len(offsets), packet.channel_id, '<u2'),
+        'time': time + delta / 1e7,
+        'ipts': ipts,
+        'status': status,
+        'gap': gather(raw, offsets + 10, '<u2'),
+        'length': length,
+        'command': words[:, 0],
+        'words': words,
+    }
+    for name, mask in FLAGS:
+        columns[name] = (status & mask) != 0
+    return columns
+
+
+def concat(parts):
+    """Join a list of column dicts."""
+
+    return {name: np.concatenate([part[name] for part in parts])
+            for name in DTYPE.names}
+
+
+def to_records(columns):
+    """Convert a dict of columns to a structured array of DTYPE."""
+
+    records = np.empty(len(columns['ipts']), dtype=DTYPE)
+    for name in DTYPE.names:
+        records[name] = columns[name]
+    return records
+
+
+def extract_1553(path, channels=(), exclude=(), chunk_size=100000,
+                 progress=None):
+    """Yield dicts of column arrays (see COLUMNS) for 1553 format 1 messages
+    in local file "path", at least "chunk_size" messages at a time (except
+    for the last chunk). "channels" and "exclude" are lists of channel
+    strings as returned by parse_filters.
+    """
+
+    index = Sidecar.load(path)
+    rows = np.flatnonzero(index.select(channels, exclude) &
+                          (index.data_type == 0x19))
+    if not len(rows):
+        return
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+
+    parts, count = [], 0
+    for row in rows.tolist():
+        packet = PacketView(view, int(index.offset[row]))
+        part = read_messages(packet, index.time[row])
+        parts.append(part)
+        count += len(part['ipts'])
+        if progress is not None:
+            progress.update(packet.packet_length)
+        if count >= chunk_size:
+            yield concat(parts)
+            parts, count = [], 0
+    if parts:
+        yield concat(parts)
+
+
+class NpyWriter:
+    """Write an array (by default 1-D of DTYPE) to a .npy file a chunk of
+    rows at a time. "shape" is the shape of each row. Room for the header is
+    reserved up front and the final shape is filled in on close().
+    """
+
+    MAGIC = b'\x93NUMPY\x01\x00'
+
+    def __init__(self, path, dtype=DTYPE, shape=()):
+        self.dtype = dtype
+        self.shape = shape
+        self.count = 0
+        self.length = len(self.header(2 ** 63))
+        self.file = open(path, 'wb')
+        self.file.write(self.header(0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def header(self, count):
+        """Return a (version 1.0) header for "count" rows."""
+
+        text = repr({
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (count,) + self.shape,
+        }).encode('latin1')
+        length = max(getattr(self, 'length', 0),
+                     len(self.MAGIC) + 2 + len(text) + 1)
+        length += -length % 64
+        return self.MAGIC + struct.pack('<H', length - 10) + \
+            text.ljust(length - 11) + b'\n'
+
+    def write(self, records):
+        self.file.write(records.astype(self.dtype, copy=False).tobytes())
+        self.count += len(records)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(self.header(self.count))
+        self.file.close()
+
+
+class NpzWriter:
+    """Write dicts of columns (see COLUMNS) to a .npz file a chunk at a
+    time. Each column is streamed to its own temporary .npy file next to
+    "path" and they're zipped up (uncompressed, as np.savez does) on
+    close().
+    """
+
+    def __init__(self, path, dtype=DTYPE):
+        self.path = path
+        self.tmp = tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(path)))
+        self.writers = {
+            name: NpyWriter(os.path.join(self.tmp.name, name + '.npy'),
+                            dtype[name].base, dtype[name].shape)
+            for name in dtype.names}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def count(self):
+        return self.writers['ipts'].count
+
+    def write(self, columns):
+        for name, writer in self.writers.items():
+            writer.write(columns[name])
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self.path, 'w', allowZip64=True) as out:
+                for name, writer in self.writers.items():
+                    writer.close()
+                    out.write(writer.file.name, name + '.npy')
+        finally:
+            self.tmp.cleanup()
+
+
+@click.command()
+@click.argument('src')
+@click.argument('dst')
+@click.option('-c', '--channel', type=str, help='Specify channels (comma-separated) to include')
+@click.option('-e', '--exclude', type=str, help='Specify channels (comma-separated) to exclude')
+@click.option('-f', '--force', is_flag=True, help='Overwrite existing files')
+@click.pass_context
+def extract(ctx, src, dst, channel, exclude, force=False):
+    """Extract 1553 format 1 messages to NumPy arrays. Writes a structured
+    array (.npy) or one array per column (.npz).
+    """
+
+    ctx.ensure_object(dict)
+
+    ext = os.path.splitext(dst)[1].lower()
+    if ext not in ('.npy', '.npz'):
+        print('Output file must end with .npy or .npz')
+        raise SystemExit
+
+    if os.path.exists(dst) and not force:
+        print('Output file exists. Use -f to overwrite.')
+        raise SystemExit
+
+    channels, exclude, _ = parse_filters({
+        '--channel': channel,
+        '--exclude': exclude,
+    })
+
+    with FileProgress(src, disable=ctx.obj.get('quiet')) as progress:
+        chunks = extract_1553(src, channels, exclude, progress=progress)
+        if ext == '.npy':
+            with NpyWriter(dst) as out:
+                for chunk in chunks:
+                    out.write(to_records(chunk))
+        else:
+            with NpzWriter(dst) as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        count = out.count
+
+    if not ctx.obj.get('quiet'):
+        print(f'Extracted {fmt_number(count)} messages to {dst}')
@@ -1,13 +1,22 @@
 
-from contextlib import suppress
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+import mmap
 import os
+import re
 import sys
 import struct
 
 from tqdm import tqdm
+from chapter10.packet import Message
 import click
+import numpy as np
 
-from c10_tools.common import find_c10, C10, walk_packets
+from c10_tools.common import find_c10, C10, PacketView, TimeRef, gather, \
+    ms1553_offsets, open_reader, parse_filters, read_range, split_file, \
+    rtc_seconds, sync_range, walk_packets
+from c10_tools.sidecar import Sidecar
 
 
 def word(b):
@@ -16,59 +25,304 @@ def word(b):
     return struct.unpack('=H', struct.pack('=BB', b[0], b[1]))[0]
 
 
+def match_1553(packet, value, cmd, length, offset, mask):
+    """Check every message in a 1553 format 1 packet at once and yield a
+    tuple of (value, ipts, pos, command) for each match, where pos is the
+    offset of the message within the packet and command is the command word
+    if "cmd" was given.
+    """
+
+    view = PacketView(packet.buffer.getvalue())
+    raw = np.frombuffer(view.data, dtype=np.uint8)
+    offsets = ms1553_offsets(view)
+    sizes = gather(raw, offsets + 12, '<u2').astype(np.int64)
+    data = offsets + 14
+
+    # Match command word (first data word) if requested.
+    keep = np.ones(len(offsets), dtype=bool)
+    if cmd:
+        keep &= sizes >= 2
+        commands = gather(raw, np.where(keep, data, 0), '<u2')
+        keep &= np.isin(commands, list(cmd))
+
+    # Build values from the bytes at offset (short messages give shorter
+    # values, as with slicing).
+    values = np.zeros(len(offsets), dtype=np.uint64)
+    for i in range(length):
+        present = offset + i < sizes
+        byte = raw[np.where(present, data + offset + i, 0)]
+        values |= np.where(present, byte, 0).astype(np.uint64) << \
+            np.uint64(i * 8)
+
+    if mask:
+        values &= np.uint64(mask)
+    if value != '*':
+        keep &= np.isin(values, np.array(list(value), dtype=np.uint64))
+
+    ipts = gather(raw, offsets, '<u8')
+    for i in np.flatnonzero(keep).tolist():
+        yield (int(values[i]), int(ipts[i]), int(offsets[i]),
+               int(commands[i]) if cmd else None)
+
+
+def match_messages(packet, value, cmd, length, offset, mask):
+    """Check messages in "packet" one at a time and yield a tuple of (value,
+    ipts, pos, command) for each match. ipts is None for messages without a
+    timestamp.
+    """
+
+    # Messages read straight from the packet's buffer can be located by its
+    # read position. Others (analog, for instance) have to be measured.
+    direct = getattr(packet, 'Message', None) and \
+        packet.Message.from_packet.__func__ is Message.from_packet.__func__
+
+    end = (36 if packet.secondary_header else 24) + 4
+    for msg in packet:
+        if direct:
+            pos, end = end, packet.buffer.tell()
+        else:
+            pos, end = end, end + len(bytes(msg))
+
+        # 1553: match command word if requested
+        command = None
+        if cmd:
+            if packet.data_type != 0x19:
+                continue
+            command = word(msg.data[:2])
+            if command not in cmd:
+                continue
+
+        # Get our value to match against and convert to int.
+        check_value = msg.data[offset:offset + length]
+        check_value = int.from_bytes(check_value, 'little')
+
+        if mask:
+            check_value &= mask
+
+        if value == '*' or check_value in value:
+            yield check_value, getattr(msg, 'ipts', None), pos, command
+
+
+def scan(c10, packets, value, cmd, length, offset, mask):
+    """Check messages in "packets" (read from "c10") and yield a tuple of
+    (value, time_ref, packet_rtc, ipts, file_pos, command) for each match.
+    "value" is "*" or a set of values and "cmd" a set of command words (or
+    None), all matched in a single pass. time_ref is a TimeRef for the most
+    recent time packet or None if there hasn't been one yet. ipts is None for
+    messages without a timestamp. command is the matching command word when
+    searching for more than one.
+    """
+
+    # 1553 packets can be checked with NumPy as long as values fit in 64
+    # bits.
+    vectorize = length <= 8 and offset >= 0 and 0 <= mask < 2 ** 64 and \
+        (value == '*' or all(0 <= v < 2 ** 64 for v in value))
+    multiple = cmd and len(cmd) > 1
+
+    time_packet, time_ref = None, None
+    for packet in packets:
+        if c10.last_time is not time_packet:
+            time_packet = c10.last_time
+            time_ref = TimeRef(time_packet)
+
+        if cmd and packet.data_type != 0x19:
+            continue
+
+        if packet.data_type == 0x19 and vectorize:
+            matches = match_1553(packet, value, cmd, length, offset, mask)
+        else:
+            matches = match_messages(packet, value, cmd, length, offset, mask)
+
+        packet_pos = c10.file.tell() - packet.packet_length
+        for check_value, ipts, pos, command in matches:
+            yield (check_value, time_ref, packet.rtc, ipts, packet_pos + pos,
+                   command if multiple else None)
+
+
+def format_match(match, length, time_ref=None):
+    """Format a match from scan() as an output line. "time_ref" is used for
+    matches found before any time packet.
+    """
+
+    check_value, ref, packet_rtc, ipts, file_pos, command = match
+    ref = ref or time_ref
+
+    # Find message time (as msg.get_time() would) and format
+    t = ''
+    if ipts is not None and ref is not None:
+        t = ref.get_time(packet_rtc) + timedelta(
+            seconds=rtc_seconds(ipts, packet_rtc))
+
+        # Julian-day format
+        if not ref.date_format:
+            t = t.strftime('%j %H:%M:%S.%f')
+
+    hex_value = f'{check_value:02x}'
+    if length:
+        hex_value = hex_value.zfill(length * 2)
+    line = f'    {hex_value}  {t} at {file_pos}'
+    if command is not None:
+        line += f' (command word {command:04x})'
+    return line
+
+
 def search(path, value, channel, exclude, type, cmd, length, offset, mask):
-    """Search file "path" based on parameters from "args"."""
+    """Search file "path" based on parameters from "args" and yield output
+    lines.
+    """
 
-    print(f'\n  {path}')
-    c10 = C10(path)
+    yield f'\n  {path}'
     args = {
         '--type': type,
         '--channel': channel,
         '--exclude': exclude
     }
-    for packet in walk_packets(c10, args):
 
-        # Assumes no secondary header.
-        pos = 28
+    # Filters make the sidecar skip around the file, so only read ahead
+    # when we're going to visit every packet.
+    if type or channel or exclude:
+        f = open(path, 'rb')
+    else:
+        f = open_reader(path)
+    with f:
+        c10 = C10(f)
+        packets = walk_packets(c10, args, sidecar=True)
+        for match in scan(c10, packets, value, cmd, length, offset, mask):
+            yield format_match(match, length)
+
+
+def find_bytes(data, patterns):
+    """Yield (offset, pattern) for every occurrence of any of "patterns" in
+    "data" (bytes or an mmap) in order.
+    """
+
+    if len(patterns) == 1:
+        pattern, = patterns
+        pos = data.find(pattern)
+        while pos >= 0:
+            yield pos, pattern
+            pos = data.find(pattern, pos + 1)
+        return
+
+    # Longest patterns first so they win at a shared offset. The lookahead
+    # allows overlapping matches.
+    patterns = sorted(patterns, key=len, reverse=True)
+    regex = re.compile(b'(?=(%s))' % b'|'.join(map(re.escape, patterns)))
+    for match in regex.finditer(data):
+        yield match.start(), match.group(1)
+
+
+def search_bytes(path, patterns, channel, exclude, type):
+    """Search packet bodies in "path" for any of "patterns" (bytes) straight
+    from a memory map and yield output lines with the channel, packet
+    offset, and time of each hit.
+    """
+
+    yield f'\n  {path}'
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+
+    index = Sidecar.load(path)
+    selected = index.select(*parse_filters({
+        '--type': type,
+        '--channel': channel,
+        '--exclude': exclude
+    }))
+
+    # Date format of each time packet, decoded as needed.
+    time_rows = np.flatnonzero(index.data_type == 0x11)
+    date_formats = {}
+
+    for pos, pattern in find_bytes(mapped, patterns):
+        row = int(np.searchsorted(index.offset, pos, 'right')) - 1
+        if row < 0 or not selected[row]:
+            continue
+
+        # Ignore hits outside of the packet body.
+        packet = PacketView(view, int(index.offset[row]))
+        body = packet.offset + (36 if packet.secondary_header else 24)
+        if pos < body or \
+                pos + len(pattern) > packet.offset + packet.packet_length:
+            continue
 
-        # Iterate over messages
-        for msg in packet:
-            pos += len(bytes(msg))
+        # Use message time for 1553 data and packet time otherwise.
+        t = index.get_time(row)
+        if t is not None:
+            if packet.data_type == 0x19:
+                offsets = ms1553_offsets(packet)
+                i = np.searchsorted(offsets, pos - packet.offset, 'right') - 1
+                if i >= 0:
+                    ipts, = struct.unpack_from('<Q', packet.data, offsets[i])
+                    t += timedelta(seconds=rtc_seconds(ipts, packet.rtc))
 
-            # 1553: match command word if requested
-            if cmd:
-                if packet.data_type != 0x19:
-                    continue
-                elif cmd != word(msg.data[:2]):
-                    continue
+            # Julian-day format unless the time packet says otherwise.
+            time_row = int(time_rows[
+                np.searchsorted(time_rows, row, 'right') - 1])
+            if time_row not in date_formats:
+                try:
+                    date_formats[time_row] = PacketView(
+                        view, int(index.offset[time_row])).decode().date_format
+                except (EOFError, ValueError):
+                    date_formats[time_row] = 0
+            if not date_formats[time_row]:
+                t = t.strftime('%j %H:%M:%S.%f')
+        t = t or ''
 
-            # Get our value to match against and convert to int.
-            check_value = msg.data[offset:offset + length]
-            check_value = int.from_bytes(check_value, 'little')
+        yield (f'    {pattern.hex()}  {t} at {pos} (channel '
+               f'{packet.channel_id}, packet at {packet.offset})')
 
-            if mask:
-                check_value &= mask
 
-            # Output matches
-            if value == '*' or check_value == value:
+def search_range(path, start, end, size, args):
+    """Search packets starting within [start, end) of "path" in a worker
+    process. Returns a list of matches from scan() and a TimeRef for the last
+    time packet in the range (or None).
+    """
 
-                # Find message time and format
-                t = ''
-                with suppress(AttributeError):
-                    t = msg.get_time()
+    value, channel, exclude, type, cmd, length, offset, mask = args
+    with open_reader(path) as f:
+        c10 = C10(f)
+        if sync_range(f, start, end, size) is None:
+            return [], None
+        packets = walk_packets(read_range(c10, end), {
+            '--type': type,
+            '--channel': channel,
+            '--exclude': exclude
+        })
+        matches = list(scan(c10, packets, value, cmd, length, offset, mask))
+    return matches, c10.last_time and TimeRef(c10.last_time)
 
-                # Julian-day format
-                if t and hasattr(c10, 'last_time') and not c10.last_time.date_format:
-                    t = t.strftime('%j %H:%M:%S.%f')
 
-                # Offset to start of message.
-                file_pos = c10.file.tell() - packet.packet_length
-                file_pos += pos - len(bytes(msg))
+def search_parallel(path, jobs, args):
+    """Search a single file by splitting it into byte ranges searched in
+    parallel. Yields output lines in file order like search().
+    """
 
-                hex_value = f'{check_value:02x}'
-                if length:
-                    hex_value = hex_value.zfill(length * 2)
-                print(f'    {hex_value}  {t} at {file_pos}')
+    yield f'\n  {path}'
+    size = os.stat(path).st_size
+    ranges = split_file(size, jobs)
+    length = args[5]
+    with ProcessPoolExecutor(jobs) as executor:
+        results = executor.map(partial(search_range, path, size=size,
+                                       args=args), *zip(*ranges))
+
+        # Matches before the first time packet in a range take their time
+        # from the previous ranges.
+        time_ref = None
+        for matches, range_time in results:
+            for match in matches:
+                yield format_match(match, length, time_ref)
+            time_ref = range_time or time_ref
+
+
+def search_file(path, args):
+    """Run search() on a single file with a tuple of search "args" and return
+    the complete output. Used with --jobs so results can be printed in order.
+    """
+
+    return '\n'.join(search(path, *args))
 
 
 def parseint(s: str) -> int:
@@ -84,36 +338,110 @@ def parseint(s: str) -> int:
         return int(s)
 
 
+def parse_bytes(s):
+    """Parse a comma-separated list of hex byte strings (spaces and a "0x"
+    prefix are allowed), or "@<path>" to read them from a file as with
+    parse_values. Returns a list of bytes. Raises click.BadParameter if
+    there are no patterns or one isn't valid hex.
+    """
+
+    if s.startswith('@'):
+        with open(s[1:]) as f:
+            s = ','.join(line.split('#')[0] for line in f)
+    patterns = []
+    for pattern in s.split(','):
+        pattern = pattern.strip()
+        if pattern.lower().startswith('0x'):
+            pattern = pattern[2:]
+        if pattern:
+            try:
+                patterns.append(bytes.fromhex(pattern))
+            except ValueError:
+                raise click.BadParameter(
+                    f'{pattern!r} is not a hex byte string',
+                    param_hint='VALUE')
+    if not patterns:
+        raise click.BadParameter('no byte patterns given', param_hint='VALUE')
+    return patterns
+
+
+def parse_values(s):
+    """Parse a comma-separated list of values (see parseint), or "@<path>"
+    to read them from a file (any number per line, "#" starts a comment).
+    Returns "*" or a frozenset of ints.
+    """
+
+    if s.startswith('@'):
+        with open(s[1:]) as f:
+            s = ','.join(line.split('#')[0] for line in f)
+    values = frozenset(parseint(v.strip()) for v in s.split(',') if v.strip())
+    if '*' in values:
+        return '*'
+    return values
+
+
 @click.command()
 @click.argument('value')
 @click.argument('path', nargs=-1)
 @click.option('-c', '--channel', type=str, help='Specify channels (comma-separated) to include')
 @click.option('-e', '--exclude', type=str, help='Specify channels (comma-separated) to exclude')
 @click.option('-t', '--type', type=str, help='Specify datatypes (comma-separated) to include')
-@click.option('--cmd', type=str, help='1553 command word')
+@click.option('--cmd', type=str, multiple=True, help='1553 command word(s) (comma-separated, @file, or repeated)')
 @click.option('-l', '--length', default=1, help='Byte length')
 @click.option('-o', '--offset', default=0, help='Byte offset within message')
 @click.option('-m', '--mask', default='0', help='Value mask')
+@click.option('-j', '--jobs', default=1, help='Number of worker processes (per file, or split within a single file)')
+@click.option('--bytes', 'raw', is_flag=True, help='Search packet bodies for VALUE as a hex byte sequence')
 @click.pass_context
-def find(ctx, value, path, channel, exclude, type, cmd, length, offset, mask):
-    """Search for a given value in Chapter 10 files."""
+def find(ctx, value, path, channel, exclude, type, cmd, length, offset, mask,
+         jobs, raw=False):
+    """Search for a given value in Chapter 10 files. VALUE may be "*", a
+    comma-separated list of values, or "@<file>" to read values from a file.
+    With --bytes, VALUE is one or more hex byte sequences instead.
+    """
 
     ctx.ensure_object(dict)
 
+    # Raw byte search doesn't look at messages.
+    if raw:
+        patterns = parse_bytes(value)
+        if len(patterns) == 1:
+            print(f'Searching for bytes {patterns[0].hex()}', end='')
+        else:
+            print(f'Searching for {len(patterns)} byte patterns', end='')
+        if channel:
+            print(f' in channel #{channel}', end='')
+        files = list(find_c10(path))
+        print(f' in {len(files)} files...')
+        for f in files:
+            for line in search_bytes(f, patterns, channel, exclude, type):
+                print(line)
+        print('\nfinished')
+        return
+
     # Validate int/hex inputs.
-    cmd = parseint(cmd)
-    value = parseint(value)
+    commands = set()
+    for c in cmd:
+        c = parse_values(c)
+        if c != '*':
+            commands |= c
+    cmd = frozenset(commands) or None
+    value = parse_values(value)
     mask = parseint(mask)
 
     # Describe the search parameters.
     value_repr = value
-    if isinstance(value_repr, int):
-        value_repr = hex(value_repr)
+    if value != '*':
+        value_repr = f'{len(value)} values'
+        if len(value) == 1:
+            value_repr = hex(next(iter(value)))
     print('Searching for %s' % value_repr, end='')
     if channel:
         print(f' in channel #{channel}', end='')
-    if cmd:
-        print(f' with command word {hex(cmd)}', end='')
+    if cmd and len(cmd) == 1:
+        print(f' with command word {hex(next(iter(cmd)))}', end='')
+    elif cmd:
+        print(f' with {len(cmd)} command words', end='')
     if offset:
         print(f' at offset {offset}', end='')
     if mask:
@@ -122,7 +450,28 @@ def find(ctx, value, path, channel, exclude, type, cmd, length, offset, mask):
     files = list(find_c10(path))
 
     print(f' in {len(files)} files...')
-    if sys.stdout.isatty() and not ctx.obj.get('quiet'):
+    args = (value, channel, exclude, type, cmd, length, offset, mask)
+    progress = sys.stdout.isatty() and not ctx.obj.get('quiet')
+
+    # Search files in worker processes and print each file's results in
+    # order as they're ready.
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = executor.map(partial(search_file, args=args), files)
+            if progress:
+                results = tqdm(
+                    results,
+                    total=len(files),
+                    desc='Overall',
+                    unit='files',
+                    dynamic_ncols=True,
+                    leave=False)
+            for output in results:
+                print(output)
+        print('\nfinished')
+        return
+
+    if progress:
         files = tqdm(
             files,
             desc='Overall',
@@ -130,5 +479,9 @@ def find(ctx, value, path, channel, exclude, type, cmd, length, offset, mask):
             dynamic_ncols=True,
             leave=False)
     for f in files:
-        search(f, value, channel, exclude, type, cmd, length, offset, mask)
+        lines = search(f, *args)
+        if jobs > 1:
+            lines = search_parallel(f, jobs, args)
+        for line in lines:
+            print(line)
     print('\nfinished')
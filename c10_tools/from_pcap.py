@@ -1,33 +1,97 @@
-
 from datetime import datetime
 import os
+import struct
 
 from chapter10.computer import ComputerF1
-from chapter10.message import MessageF0
 from chapter10.time import TimeF1
-from dpkt import pcap
-from dpkt.ethernet import Ethernet
-from dpkt.udp import UDP
 import click
 
-from c10_tools.common import FileProgress, fmt_number
+from c10_tools.common import AsyncWriter, FileProgress, Header, fmt_number
+from c10_tools.pcap import PcapReader, parse_ports
+
+
+class Packetizer:
+    """Accumulate network messages for one channel and write them as Message
+    format 0 packets. Packets are assembled directly into a reusable buffer
+    (CSDW followed by intra-packet headers and data).
+    """
+
+    IPH = struct.Struct('<QHH')
+    MAX_COUNT = 0xffff
+
+    def __init__(self, channel_id, out):
+        self.channel_id = channel_id
+        self.out = out
+        self.body = bytearray(4)
+        self.count, self.sequence = 0, 0
+        self.rtc, self.start = 0, None
+        self.packets = 0
+
+    def __len__(self):
+        return len(self.body)
+
+    def add(self, timestamp, rtc, data):
+        """Append a message received at "timestamp" (RTC "rtc")."""
+
+        if not self.count:
+            self.start, self.rtc = timestamp, rtc
+        self.body += self.IPH.pack(rtc, len(data), 0)
+        self.body += data
+        if len(data) % 2:
+            self.body.append(0)
+        self.count += 1
+
+    def flush(self):
+        """Write any pending messages as a packet."""
+
+        if not self.count:
+            return
+
+        struct.pack_into('<I', self.body, 0, self.count)
+        data_length = len(self.body)
+        self.body += bytes(-data_length % 4)
+        values = [0xeb25, self.channel_id, 24 + len(self.body), data_length,
+                  0, self.sequence, 0, 0x30, self.rtc & 0xffffffff,
+                  self.rtc >> 32, 0]
+        values[-1] = sum(Header.WORDS.unpack_from(
+            Header.FORMAT.pack(*values))) & 0xffff
+        self.out.write(Header.FORMAT.pack(*values))
+        self.out.write(self.body)
+
+        self.sequence = (self.sequence + 1) & 0xff
+        self.packets += 1
+        self.count, self.start = 0, None
+        del self.body[4:]
 
 
 class Parser:
-    start_timestamp, seq = 0, {}
-    network_packets, c10_packets = 0, 0
+    start_timestamp = 0
+    network_packets = 0
     last_time = 0
     MAX_BODY_SIZE = 400000
+    max_latency = None
+    ports = None
 
     def __init__(self, **kwargs):
+        self.seq = {}
+        self.channels = {}
+        self.default_channel, self.port_channels = 32, {}
         self.__dict__.update(kwargs)
 
+    @property
+    def c10_packets(self):
+        return sum(p.packets for p in self.channels.values())
+
     def make_rtc(self, timestamp):
         """Take a timestamp and give an incrementing 10Mhz equivalent time."""
 
+        # Time packets carry whole seconds (see write_time), so start the
+        # clock on the second before the first message. The first time
+        # packet then gets RTC 0 instead of a negative (wrapped) RTC, and
+        # the time/RTC pair is exact rather than rounded to the 10 ms
+        # resolution of the time packet format.
         if not self.start_timestamp:
-            self.start_timestamp = timestamp
-            return 0
+            self.start_timestamp = int(timestamp)
 
         offset = timestamp - self.start_timestamp
 
@@ -42,27 +106,11 @@ class Parser:
         tmats = ComputerF1(data_type=1, data=tmats_body)
         self.out.write(bytes(tmats))
 
-    def write_data(self, messages):
-        """Make a Message packet from a list of messages."""
-
-        timestamp = messages[0][0]
-        while timestamp - self.last_time > 1:
-            self.write_time(timestamp)
-
-        p = MessageF0(channel_id=32, data_type=0x30,
-                      count=len(messages), rtc=self.make_rtc(timestamp),
-                      sequence_number=self.get_seq(32))
-        p._messages = [m[1] for m in messages]
-        self.c10_packets += 1
-        self.out.write(bytes(p))
-
     def get_seq(self, channel):
         """Get a valid sequence number for a given channel ID."""
 
-        sequence_number = self.seq.get(0, 0)
-        self.seq[channel] = sequence_number + 1
-        if sequence_number == 255:
-            self.seq[channel] = 0
+        sequence_number = self.seq.get(channel, 0)
+        self.seq[channel] = (sequence_number + 1) & 0xff
         return sequence_number
 
     def write_time(self, timestamp):
@@ -79,42 +127,67 @@ class Parser:
                         sequence_number=self.get_seq(0))
         self.out.write(bytes(packet))
 
-    def parse_udp(self, timestamp, data):
+    def get_channel(self, port):
+        """Return the Packetizer for a UDP port (or None to skip it)."""
+
+        channel_id = self.port_channels.get(port, self.default_channel)
+        if channel_id is None:
+            return None
+        if channel_id not in self.channels:
+            self.channels[channel_id] = Packetizer(channel_id, self.out)
+        return self.channels[channel_id]
+
+    def add(self, timestamp, port, data):
+        """Add one UDP payload, writing packets as they fill up or age."""
+
+        # Once a second write out each channel's pending messages and mark
+        # the time. Channels are flushed one after another, so packets from
+        # different channels aren't strictly in time order.
+        if timestamp - self.last_time >= 1:
+            self.flush()
+            while timestamp - self.last_time >= 1:
+                self.write_time(timestamp)
+
+        if self.max_latency is not None:
+            for channel in self.channels.values():
+                if channel.count and \
+                        timestamp - channel.start >= self.max_latency:
+                    channel.flush()
+
+        channel = self.get_channel(port)
+        if channel is None:
+            return
         self.network_packets += 1
-        msg = MessageF0.Message(ipts=self.make_rtc(timestamp),
-                                length=len(data),
-                                data=data)
-        return bytes(msg)
 
-    def parse_and_write(self):
-        """Parse a pcap file into chapter 10 format."""
+        length = Packetizer.IPH.size + len(data) + len(data) % 2
+        if channel.count and (len(channel) + length > self.MAX_BODY_SIZE or
+                              channel.count == Packetizer.MAX_COUNT):
+            channel.flush()
+        channel.add(timestamp, self.make_rtc(timestamp), data)
 
-        self.out = open(self.outfile, 'wb')
+    def flush(self):
+        """Write all pending packets."""
 
-        if self.tmats:
-            self.write_tmats()
+        for channel in self.channels.values():
+            channel.flush()
 
-        with FileProgress(self.infile, disable=self.quiet) as progress:
+    def parse_and_write(self):
+        """Parse a pcap file into chapter 10 format."""
 
-            f = open(self.infile, 'rb')
-            length, messages = 0, []
-            for timestamp, ethernet in pcap.Reader(f):
-                ip = Ethernet(ethernet).data
-                if isinstance(getattr(ip, 'data', None), UDP):
-                    msg = self.parse_udp(timestamp, ip.data.data[4:])
-                    messages.append((timestamp, msg))
-                    length += len(msg)
+        with AsyncWriter(self.outfile) as self.out:
 
-                    # Write packet when full.
-                    if length > self.MAX_BODY_SIZE:
-                        self.write_data(messages)
-                        length, messages = 0, []
+            if self.tmats:
+                self.write_tmats()
 
-                progress.update_from_tell(f.tell())
+            with open(self.infile, 'rb') as f, \
+                    FileProgress(self.infile, disable=self.quiet) as progress:
+                reader = PcapReader(f, self.ports)
+                for timestamp, _, port, data in reader:
+                    self.add(timestamp, port, data[4:])
+                    progress.update_from_tell(reader.tell())
 
-        # Write any remaining messages.
-        if messages:
-            self.write_data(messages)
+            # Write any remaining messages.
+            self.flush()
 
         if not self.quiet:
             print('Created %s Chapter 10 packets from %s network packets'
@@ -122,14 +195,36 @@ class Parser:
                        fmt_number(self.network_packets)))
 
 
-# @TODO: make channel # and datatype options
+def parse_channels(s):
+    """Parse a channel ID or comma-separated PORT=ID pairs (optionally
+    with a bare ID for any other port). Returns the default channel (or
+    None) and a dict of {port: channel ID}.
+    """
+
+    if not s:
+        return 32, {}
+    default, ports = None, {}
+    for item in s.split(','):
+        if '=' in item:
+            port, channel_id = item.split('=')
+            ports[int(port)] = int(channel_id)
+        else:
+            default = int(item)
+    return default, ports
+
+
 @click.command()
 @click.argument('infile')
 @click.argument('outfile')
 @click.option('-f', '--force', is_flag=True, help='Overwrite existing files')
 @click.option('-t', '--tmats', help='Insert an existing TMATS record at the beginning off the output file')
+@click.option('-p', '--port', type=str, help='Only read these UDP ports (comma-separated)')
+@click.option('-c', '--channel', type=str, help='Channel ID for all data (default 32) or PORT=ID pairs (comma-separated) to assign channels by destination port')
+@click.option('-s', '--max-size', type=click.IntRange(1, 524288), default=Parser.MAX_BODY_SIZE, show_default=True, help='Largest packet body in bytes')
+@click.option('-l', '--max-latency', type=float, help='Write packets once their first message is this many seconds old')
 @click.pass_context
-def frompcap(ctx, infile, outfile, force=False, tmats=None):
+def frompcap(ctx, infile, outfile, force=False, tmats=None, port=None,
+             channel=None, max_size=Parser.MAX_BODY_SIZE, max_latency=None):
     """Wrap network data in a pcap file as Chapter 10 Message format."""
 
     ctx.ensure_object(dict)
@@ -138,10 +233,16 @@ def frompcap(ctx, infile, outfile, force=False, tmats=None):
         print('Output file exists. Use -f to overwrite.')
         raise SystemExit
 
+    default_channel, port_channels = parse_channels(channel)
     p = Parser(infile=infile,
                outfile=outfile,
                force=force,
                tmats=tmats,
+               ports=parse_ports(port),
+               default_channel=default_channel,
+               port_channels=port_channels,
+               MAX_BODY_SIZE=max_size,
+               max_latency=max_latency,
                verbose=ctx.obj.get('verbose'),
                quiet=ctx.obj.get('quiet'))
     p.parse_and_write()
@@ -1,15 +1,127 @@
 
 from collections import OrderedDict
-import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
 import csv
 import os
+import struct
 import sys
 
-from chapter10 import C10
 from termcolor import colored
 import click
 
-from .common import fmt_number, FileProgress, walk_packets
+from .common import fmt_number, FileProgress, OutputBuffer, PacketView, \
+    TimeRef, open_reader, parse_filters, read_packet, split_file, \
+    walk_headers, walk_range
+
+
+class Row:
+    """Picklable stand-in for a packet with just what write_row() needs, for
+    passing results back from worker processes.
+    """
+
+    __slots__ = ('channel_id', 'data_type', 'sequence_number',
+                 'packet_length', 'rtc', 'date_format', 'valid', 'offset',
+                 'time_ref')
+
+    def __init__(self, header, time_ref, valid=True):
+        self.channel_id = header.channel_id
+        self.data_type = header.data_type
+        self.sequence_number = header.sequence_number
+        self.packet_length = header.packet_length
+        self.rtc = header.rtc
+        self.date_format = time_ref and time_ref.date_format
+        self.valid = valid
+        self.offset = header.offset
+        self.time_ref = time_ref
+
+    def validate(self, silent=False):
+        return self.valid
+
+    def get_time(self):
+        if self.time_ref is None:
+            return datetime.now()
+        return self.time_ref.get_time(self.rtc)
+
+
+def check_packet(f, header):
+    """Check the secondary header and data checksums of a packet whose
+    primary header is already valid. The body is only read if the header
+    says there's something to check.
+    """
+
+    if not (header.secondary_header or header.data_checksum):
+        return True
+
+    f.seek(header.offset)
+    packet = PacketView(memoryview(f.read(header.packet_length)))
+    if header.secondary_header:
+        words = struct.unpack_from('<6H', packet.data, 24)
+        if sum(words[:5]) & 0xffff != words[5]:
+            return False
+    return packet.checksum_valid()
+
+
+class Scanner:
+    """Walk packet headers and yield a Row for each packet passing the
+    channel/type filters, plus an error message wherever the file had to be
+    resynced. Only time packets are decoded; "time_ref" tracks the latest.
+    """
+
+    def __init__(self, args):
+        self.channels, self.exclude, self.types = parse_filters(args)
+        self.time_ref = None
+
+    def scan(self, f, size, start=None, end=None):
+        """Yield rows and messages for the whole file or, if "start" is
+        given, for packets starting within [start, end).
+        """
+
+        errors = []
+
+        def on_error(offset, msg):
+            errors.append(f'{msg} at {fmt_number(offset)}')
+
+        if start is None:
+            headers = walk_headers(f, size, on_error)
+        else:
+            headers = walk_range(f, start, end, size, on_error)
+
+        for header in headers:
+            yield from errors
+            errors.clear()
+
+            if header.data_type == 0x11:
+                try:
+                    self.time_ref = TimeRef(read_packet(f, header))
+                except Exception as err:
+                    yield f'{err} at {fmt_number(header.offset)}'
+
+            channel = str(header.channel_id)
+            if self.channels and channel not in self.channels:
+                continue
+            elif channel in self.exclude:
+                continue
+            elif self.types and header.data_type not in self.types:
+                continue
+
+            yield Row(header, self.time_ref, check_packet(f, header))
+
+        yield from errors
+
+
+def inspect_range(path, start, end, size, args):
+    """Read packets starting within [start, end) of "path" in a worker
+    process. Returns a list of Row objects and error messages, and a TimeRef
+    for the last time packet in the range (or None). Rows before the first
+    time packet in the range have no time_ref yet.
+    """
+
+    scanner = Scanner(args)
+    with open_reader(path) as f:
+        items = list(scanner.scan(f, size, start, end))
+    return items, scanner.time_ref
 
 
 class Inspect:
@@ -42,17 +154,19 @@ class Inspect:
         return sum(os.stat(f).st_size for f in self.infile)
 
     def write_header(self):
-        """Write out header row for CSV or ASCII."""
+        """Write out header row for CSV or ASCII. Returns the rule line to
+        close an ASCII table with (or '').
+        """
 
         if self.writer:
             self.writer.writerow(self.cols.keys())
             return ''
 
-        else:
-            s = ' | '.join([f'{key:<{width}}'
-                            for key, width in self.cols.items()])
-            line = '-' * (len(s) + 4)
-            return f'{line}\n| {s} |\n{line}'
+        s = ' | '.join([f'{key:<{width}}'
+                        for key, width in self.cols.items()])
+        line = '-' * (len(s) + 4)
+        self.output.write(f'{line}\n| {s} |\n{line}')
+        return line
 
     def write_row(self, packet, offset):
         """Pull values from a packet and write output row."""
@@ -84,107 +198,93 @@ class Inspect:
 
             row.append(val)
 
-        s = ''
         if self.writer:
             self.writer.writerow(row)
-
         else:
-            widths = list(self.cols.values())
-            s = '|'
-            for i, col in enumerate(row):
-                s += f' {col:<{widths[i]}} |'
-
-        return s
-
-    async def get_packet(self, c10):
-        """Read and return the next packet from a file or raise
-        StopAsyncIteration.
-        """
+            self.output.write('|' + ''.join(
+                f' {col:<{width}} |'
+                for col, width in zip(row, self.cols.values())))
 
-        try:
-            packet = next(c10)
-            assert packet.packet_length == len(bytes(packet)), \
-                'Packet length incorrect'
-        except StopIteration:
-            raise StopAsyncIteration
-        return packet
-
-    def find_sync(self, f):
-        """Seek forward in a file to the next sync pattern (eb25)."""
-
-        while True:
-            offset = f.tell()
-            buffer = f.read(100000)
-            if not buffer:
-                raise EOFError
-            if b'\x25\xeb' in buffer:
-                f.seek(offset + buffer.find(b'\x25\xeb'))
-                return f.tell()
-
-    def parse_file(self, f, progress):
-        """Walk a file and read header information."""
-
-        offset = 0
-        args = {
+    def args(self):
+        return {
             '--channel': self.channel,
             '--exclude': self.exclude,
             '--type': self.type,
         }
-        c10 = walk_packets(C10(f), args, include_time=False)
-        while True:
-
-            # Try to read a packet.
-            try:
-                packet = asyncio.run(
-                    asyncio.wait_for(self.get_packet(c10), timeout=.1))
-                progress.write(self.write_row(packet, offset))
-                progress.update(packet.packet_length)
-                offset += packet.packet_length
-
-            # Report error and retry at the next sync pattern.
-            except Exception as err:
-
-                # Exit if we've read the whole file.
-                if offset >= os.stat(f.name).st_size:
-                    break
-
-                if not isinstance(err, StopAsyncIteration):
-                    msg = f'{err} at {fmt_number(offset)}'
-                    if self.writer is None:
-                        progress.write(colored(msg, 'red'))
-                    else:
-                        progress.write(f'"{msg}"')
 
-                try:
-                    f.seek(offset + 1, 1)
-                    sync = self.find_sync(f)
-                except EOFError:
-                    break
-                progress.update(sync - offset)
-                offset = sync
+    def write_error(self, msg):
+        if self.writer is None:
+            self.output.write(colored(msg, 'red'))
+        else:
+            self.output.write(f'"{msg}"')
+
+    def parse_file(self, f, base=0):
+        """Walk a file and read header information. "base" is the number of
+        bytes in earlier files (for progress).
+        """
+
+        size = os.fstat(f.fileno()).st_size
+        for item in Scanner(self.args()).scan(f, size):
+            if isinstance(item, str):
+                self.write_error(item)
+                continue
+            self.output.move(base + item.offset + item.packet_length)
+            self.write_row(item, item.offset)
+        self.output.move(base + size)
+
+    def parse_parallel(self, path, base=0):
+        """Split a file into byte ranges read by worker processes and write
+        rows in file order.
+        """
+
+        size = os.stat(path).st_size
+        ranges = split_file(size, self.jobs)
+        with ProcessPoolExecutor(self.jobs) as executor:
+            results = executor.map(partial(inspect_range, path, size=size,
+                                           args=self.args()), *zip(*ranges))
+
+            # Rows before the first time packet in a range take their time
+            # from the previous ranges.
+            time_ref = None
+            for (items, range_time), (start, end) in zip(results, ranges):
+                for item in items:
+                    if isinstance(item, str):
+                        self.write_error(item)
+                        continue
+                    item.time_ref = item.time_ref or time_ref
+                    self.write_row(item, item.offset)
+                time_ref = range_time or time_ref
+                self.output.move(base + end)
 
     def main(self):
 
         # Use CSV if stdout is redirected
-        self.writer = None
-        if sys.stdout == sys.stderr:
-            pass
-        elif not sys.stdout.isatty():
-            self.writer = csv.writer(sys.stdout, lineterminator='')
+        csv_mode = sys.stdout != sys.stderr and not sys.stdout.isatty()
 
         progress = FileProgress(total=self.get_size(),
-                                disable=self.quiet or self.writer)
+                                disable=self.quiet or csv_mode)
+
+        # Rows (CSV or ASCII) are written out in batches.
+        self.output = OutputBuffer(progress)
+        self.writer = None
+        if csv_mode:
+            self.writer = csv.writer(self.output, lineterminator='')
 
-        header = self.write_header()
-        progress.write(header)
+        footer = self.write_header()
 
+        base = 0
         for f in self.infile:
-            with open(f, 'rb') as f:
-                self.parse_file(f, progress)
+            if self.jobs > 1:
+                self.parse_parallel(f, base)
+            else:
+                with open_reader(f) as reader:
+                    self.parse_file(reader, base)
+            base += os.stat(f).st_size
 
         # Closing line if we're in ASCII mode.
-        if header:
-            progress.write(header.split('\n', 1)[0])
+        if footer:
+            self.output.write(footer)
+        self.output.close()
 
 
 @click.command()
@@ -192,8 +292,9 @@ class Inspect:
 @click.option('-c', '--channel', type=str, help='Specify channels (comma-separated) to include')
 @click.option('-e', '--exclude', type=str, help='Specify channels (comma-separated) to exclude')
 @click.option('-t', '--type', type=str, help='Specify datatypes (comma-separated) to include')
+@click.option('-j', '--jobs', default=1, help='Number of worker processes to split each file between')
 @click.pass_context
-def inspect(ctx, infile, channel, exclude, type):
+def inspect(ctx, infile, channel, exclude, type, jobs):
     """Report on packets found in a file."""
 
     ctx.ensure_object(dict)
@@ -203,6 +304,7 @@ def inspect(ctx, infile, channel, exclude, type):
         channel=channel,
         exclude=exclude,
         type=type,
+        jobs=jobs,
         verbose=ctx.obj.get('verbose'),
         quiet=ctx.obj.get('quiet'),
     ).main()
\ No newline at end of file
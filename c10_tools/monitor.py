@@ -0,0 +1,283 @@
+
+from collections import deque
+import asyncio
+import time
+
+import click
+
+from c10_tools.common import fmt_number, fmt_size, fmt_table
+from c10_tools.stream import udp_socket
+from c10_tools.streamcheck import StreamProtocol, watch
+
+
+class RollingSum:
+    """Sum of values added over the last "count" buckets of "width" seconds.
+    Adding is O(1); old buckets are dropped as time moves on.
+    """
+
+    def __init__(self, count=10, width=1.0):
+        self.width = width
+        self.buckets = deque([0], maxlen=count)
+        self.total = 0
+        self.start, self.end = None, None
+
+    def advance(self, now):
+        if self.end is None:
+            self.start, self.end = now, now + self.width
+        if now - self.end >= self.width * self.buckets.maxlen:
+            self.buckets.clear()
+            self.buckets.append(0)
+            self.total = 0
+            self.end = now + self.width
+        while now >= self.end:
+            if len(self.buckets) == self.buckets.maxlen:
+                self.total -= self.buckets[0]
+            self.buckets.append(0)
+            self.end += self.width
+
+    def add(self, value, now):
+        self.advance(now)
+        self.buckets[-1] += value
+        self.total += value
+
+    def rate(self, now):
+        """Average per second over the window, or over the time since the
+        first value (at least one bucket) until the window has filled.
+        """
+
+        self.advance(now)
+        span = self.width * self.buckets.maxlen
+        span = min(max(now - self.start, self.width), span)
+        return self.total / span
+
+
+class ChannelHealth:
+    """Counters and rolling rates for one channel.
+
+    - sequence_errors: packets whose sequence number wasn't the next one
+    - missing: packets skipped according to sequence numbers
+    - late: duplicate or reordered packets (sequence number at or behind the
+      last one), which don't count as gaps
+    - rtc_jumps: RTC changes that disagree with arrival times by more than
+      "tolerance" seconds (including the RTC going backwards)
+    - checksum_errors: packets with a bad data checksum
+    """
+
+    def __init__(self, channel_id, window=10, tolerance=0.5):
+        self.channel_id = channel_id
+        self.tolerance = tolerance
+        self.packets, self.bytes = 0, 0
+        self.sequence_errors, self.missing, self.late = 0, 0, 0
+        self.rtc_jumps, self.checksum_errors = 0, 0
+        self.packet_rate = RollingSum(window)
+        self.byte_rate = RollingSum(window)
+        self.last = None
+
+    def add(self, packet, now):
+        self.packets += 1
+        self.bytes += packet.packet_length
+        self.packet_rate.add(1, now)
+        self.byte_rate.add(packet.packet_length, now)
+
+        if not packet.checksum_valid():
+            self.checksum_errors += 1
+
+        if self.last is not None:
+            sequence, rtc, arrival = self.last
+            skipped = (packet.sequence_number - sequence - 1) & 0xff
+
+            # A step back (255 is a repeat of the last number) is a
+            # duplicate or late packet, so leave the last packet in place.
+            if skipped >= 0x80:
+                self.late += 1
+                return
+            if skipped:
+                self.sequence_errors += 1
+                self.missing += skipped
+
+            # Signed 48-bit RTC difference in seconds.
+            delta = (packet.rtc - rtc) & 0xffffffffffff
+            if delta >= 1 << 47:
+                delta -= 1 << 48
+            if delta < 0 or \
+                    abs(delta / 10_000_000 - (now - arrival)) > self.tolerance:
+                self.rtc_jumps += 1
+
+        self.last = packet.sequence_number, packet.rtc, now
+
+
+class StreamHealth:
+    """Health of every channel in a stream, fed by a StreamProtocol."""
+
+    METRICS = (
+        ('packets', 'counter', 'Packets received'),
+        ('bytes', 'counter', 'Bytes received'),
+        ('packets_per_second', 'gauge', 'Packet rate over the window'),
+        ('bytes_per_second', 'gauge', 'Byte rate over the window'),
+        ('sequence_errors', 'counter', 'Out of sequence packets'),
+        ('missing', 'counter', 'Packets missing by sequence number'),
+        ('late', 'counter', 'Duplicate or reordered packets'),
+        ('rtc_jumps', 'counter', 'RTC discontinuities'),
+        ('checksum_errors', 'counter', 'Packets with a bad data checksum'),
+    )
+
+    def __init__(self, window=10, tolerance=0.5):
+        self.window = window
+        self.tolerance = tolerance
+        self.channels = {}
+        self.protocol = None
+
+    def add(self, packet, now):
+        channel = self.channels.get(packet.channel_id)
+        if channel is None:
+            channel = self.channels[packet.channel_id] = ChannelHealth(
+                packet.channel_id, self.window, self.tolerance)
+        channel.add(packet, now)
+
+    def values(self, now):
+        """Yield (channel, {metric: value}) for each channel."""
+
+        for channel_id in sorted(self.channels):
+            channel = self.channels[channel_id]
+            yield channel, {
+                'packets': channel.packets,
+                'bytes': channel.bytes,
+                'packets_per_second': channel.packet_rate.rate(now),
+                'bytes_per_second': channel.byte_rate.rate(now),
+                'sequence_errors': channel.sequence_errors,
+                'missing': channel.missing,
+                'late': channel.late,
+                'rtc_jumps': channel.rtc_jumps,
+                'checksum_errors': channel.checksum_errors,
+            }
+
+    def summary(self, now):
+        """Return a table of per-channel health."""
+
+        table = [('Channel', 'Packets', 'Rate', 'Packets/s', 'Missing',
+                  'RTC jumps', 'Checksum errors')]
+        for channel, values in self.values(now):
+            table.append((
+                f'Channel {channel.channel_id:2}',
+                fmt_number(values['packets']),
+                fmt_size(values['bytes_per_second']) + '/s',
+                f"{values['packets_per_second']:.1f}",
+                fmt_number(values['missing']),
+                fmt_number(values['rtc_jumps']),
+                fmt_number(values['checksum_errors']),
+            ))
+        if len(table) == 1:
+            return 'No packets received'
+        return fmt_table(table)
+
+    def prometheus(self, now):
+        """Return metrics in the Prometheus text exposition format."""
+
+        rows = list(self.values(now))
+        lines = []
+        for name, kind, description in self.METRICS:
+            metric = f'c10_{name}' + ('_total' if kind == 'counter' else '')
+            lines += [f'# HELP {metric} {description}',
+                      f'# TYPE {metric} {kind}']
+            for channel, values in rows:
+                value = values[name]
+                if isinstance(value, float):
+                    value = f'{value:.3f}'
+                lines.append(
+                    f'{metric}{{channel="{channel.channel_id}"}} {value}')
+        if self.protocol is not None:
+            lines += [
+                '# HELP c10_skipped_bytes_total Bytes skipped between packets',
+                '# TYPE c10_skipped_bytes_total counter',
+                f'c10_skipped_bytes_total {self.protocol.parser.skipped}',
+                '# HELP c10_lost_datagrams_total Datagrams missing by '
+                'transfer sequence number',
+                '# TYPE c10_lost_datagrams_total counter',
+                f'c10_lost_datagrams_total {self.protocol.transfer.lost}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+async def serve_metrics(health, host, port):
+    """Serve health.prometheus() over HTTP at "host":"port"."""
+
+    loop = asyncio.get_running_loop()
+
+    async def respond(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        body = health.prometheus(loop.time()).encode()
+        writer.write(b'HTTP/1.0 200 OK\r\n'
+                     b'Content-Type: text/plain; version=0.0.4\r\n'
+                     b'Content-Length: %d\r\n\r\n' % len(body) + body)
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(respond, host, port)
+
+
+async def run(sock, health, interval=5.0, http=None, duration=None,
+              channels=None, out=print):
+    """Watch "sock", printing a summary every "interval" seconds (if set)
+    and serving metrics on "http" ((host, port), if set).
+    """
+
+    health.protocol = StreamProtocol(health.add, channels)
+    server = http and await serve_metrics(health, *http)
+    next_summary = None
+
+    def refresh(now):
+        nonlocal next_summary
+        if not interval:
+            return
+        if next_summary is None:
+            next_summary = now + interval
+        elif now >= next_summary:
+            next_summary += interval
+            out(health.summary(now))
+
+    try:
+        await watch(sock, health.protocol, refresh, 10, duration)
+    finally:
+        if server:
+            server.close()
+            await server.wait_closed()
+
+
+@click.command()
+@click.argument('dsthost')
+@click.argument('dstport', type=int)
+@click.option('-c', '--channel', type=str, help='Only watch these channels (comma-separated)')
+@click.option('-i', '--interval', type=float, default=5.0, show_default=True, help='Seconds between summaries (0 for none)')
+@click.option('-w', '--window', type=int, default=10, show_default=True, help='Seconds to average rates over')
+@click.option('-t', '--tolerance', type=float, default=0.5, show_default=True, help='Seconds RTC may drift from arrival time before counting a jump')
+@click.option('--http', type=str, help='Serve Prometheus metrics at [host:]port')
+@click.option('-d', '--duration', type=float, help='Stop after this many seconds')
+@click.pass_context
+def monitor(ctx, dsthost, dstport, channel=None, interval=5.0, window=10,
+            tolerance=0.5, http=None, duration=None):
+    """Watch the health of every channel in a live Chapter 10 stream: data
+    rates, sequence gaps, RTC jumps, and checksum errors.
+    """
+
+    ctx.ensure_object(dict)
+
+    channels = channel and {int(c) for c in channel.split(',')}
+    if http:
+        host, _, port = http.rpartition(':')
+        http = host or '127.0.0.1', int(port)
+
+    health = StreamHealth(window, tolerance)
+    sock = udp_socket(dsthost, dstport)
+    sock.setblocking(False)
+    try:
+        asyncio.run(run(sock, health, interval, http, duration, channels))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+    if not ctx.obj.get('quiet'):
+        print(health.summary(time.monotonic()))
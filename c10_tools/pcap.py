@@ -0,0 +1,188 @@
+
+import mmap
+import struct
+
+import dpkt
+
+
+# Link-layer decoders for frames the fast path doesn't handle.
+LINK_TYPES = {
+    1: dpkt.ethernet.Ethernet,
+    101: dpkt.ip.IP,
+    113: dpkt.sll.SLL,
+    228: dpkt.ip.IP,
+}
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+
+
+class PcapReader:
+    """Iterate over UDP payloads in a pcap or pcapng file, yielding
+    (timestamp, src port, dst port, payload). Plain Ethernet/IPv4/UDP frames
+    are decoded at fixed offsets; anything else (VLAN tags, IPv6, IP
+    fragments, other link types) is handed to dpkt. If "ports" is given only
+    datagrams to or from one of those ports are returned (like BPF
+    "udp port N").
+
+    tell() gives the current position in the file for progress bars.
+    """
+
+    def __init__(self, f, ports=None):
+        self.ports = ports and frozenset(ports)
+        self.pos = 0
+        try:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.buf = b''
+        self.view = memoryview(self.buf)
+
+    def __iter__(self):
+        magic = bytes(self.buf[:4])
+        if magic == PCAPNG_MAGIC:
+            frames = self.pcapng_frames()
+        elif magic in PCAP_MAGIC:
+            frames = self.pcap_frames(*PCAP_MAGIC[magic])
+        elif not magic:
+            return
+        else:
+            raise ValueError('Not a pcap or pcapng file')
+
+        for timestamp, link_type, frame in frames:
+            if link_type == 1:
+                udp = self.decode_ethernet(frame)
+            else:
+                udp = self.decode_other(link_type, frame)
+            if udp is None:
+                continue
+            src, dst, payload = udp
+            if self.ports and src not in self.ports and dst not in self.ports:
+                continue
+            yield timestamp, src, dst, payload
+
+    def tell(self):
+        return self.pos
+
+    def pcap_frames(self, endian, resolution):
+        """Yield (timestamp, link type, frame) from a pcap file."""
+
+        link_type, = struct.unpack_from(endian + 'I', self.buf, 20)
+        record = struct.Struct(endian + 'IIII')
+        view, end = self.view, len(self.buf)
+        self.pos = pos = 24
+        while pos + 16 <= end:
+            seconds, fraction, length, _ = record.unpack_from(self.buf, pos)
+            pos += 16
+
+            # The last record may be cut short.
+            length = min(length, end - pos)
+            self.pos = pos + length
+            yield (seconds + fraction * resolution, link_type,
+                   view[pos:pos + length])
+            pos += length
+
+    def pcapng_frames(self):
+        """Yield (timestamp, link type, frame) from a pcapng file."""
+
+        view, end = self.view, len(self.buf)
+        endian, interfaces = '<', []
+        pos = 0
+        while pos + 12 <= end:
+            if bytes(self.buf[pos:pos + 4]) == PCAPNG_MAGIC:
+                # Section header: byte order and a new set of interfaces.
+                endian = '<' if self.buf[pos + 8:pos + 12] == \
+                    b'\x4d\x3c\x2b\x1a' else '>'
+                interfaces = []
+            block_type, length = struct.unpack_from(endian + 'II',
+                                                    self.buf, pos)
+            if length < 12 or pos + length > end:
+                break
+            body = pos + 8
+            self.pos = pos + length
+
+            # Interface description
+            if block_type == 1:
+                link_type, = struct.unpack_from(endian + 'H', self.buf, body)
+                interfaces.append((link_type, self.tsresol(
+                    endian, body + 8, pos + length - 4)))
+
+            # Enhanced packet
+            elif block_type == 6:
+                interface, high, low, captured = struct.unpack_from(
+                    endian + 'IIII', self.buf, body)
+                link_type, resolution = interfaces[interface]
+                start = body + 20
+                yield (((high << 32) | low) * resolution, link_type,
+                       view[start:start + captured])
+
+            # Simple packet (no timestamp)
+            elif block_type == 3:
+                link_type, _ = interfaces[0]
+                captured = min(struct.unpack_from(endian + 'I', self.buf,
+                                                  body)[0], length - 16)
+                yield 0.0, link_type, view[body + 4:body + 4 + captured]
+
+            pos += length
+
+    def tsresol(self, endian, pos, end):
+        """Find the timestamp resolution in interface description options."""
+
+        while pos + 4 <= end:
+            code, length = struct.unpack_from(endian + 'HH', self.buf, pos)
+            if code == 0:
+                break
+            if code == 9:
+                value = self.buf[pos + 4]
+                if value & 0x80:
+                    return 2.0 ** -(value & 0x7f)
+                return 10.0 ** -value
+            pos += 4 + length + (-length % 4)
+        return 1e-6
+
+    def decode_ethernet(self, frame):
+        """Return (src port, dst port, payload) from an Ethernet frame or
+        None if it isn't UDP.
+        """
+
+        if len(frame) < 42 or frame[12] != 8 or frame[13] != 0 or \
+                frame[14] != 0x45:
+            return self.decode_other(1, frame)
+
+        # Not UDP
+        if frame[23] != 17:
+            return None
+
+        # Fragmented
+        if frame[20] & 0x3f or frame[21]:
+            return self.decode_other(1, frame)
+
+        total_length = (frame[16] << 8) | frame[17]
+        src, dst, length = struct.unpack_from('>HHH', frame, 34)
+        end = min(34 + length, 14 + total_length, len(frame))
+        return src, dst, bytes(frame[42:end])
+
+    def decode_other(self, link_type, frame):
+        """Use dpkt to find the UDP payload in "frame" (or None)."""
+
+        try:
+            decoded = LINK_TYPES[link_type](bytes(frame))
+        except (KeyError, dpkt.UnpackError):
+            return None
+        while not isinstance(decoded, dpkt.udp.UDP):
+            decoded = getattr(decoded, 'data', None)
+            if not isinstance(decoded, dpkt.Packet):
+                return None
+        return decoded.sport, decoded.dport, bytes(decoded.data)
+
+
+def parse_ports(s):
+    """Parse a comma-separated list of ports (or None)."""
+
+    if not s:
+        return None
+    return frozenset(int(port) for port in s.split(','))
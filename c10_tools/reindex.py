@@ -4,7 +4,8 @@ import os
 from chapter10.computer import ComputerF3
 import click
 
-from c10_tools.common import FileProgress, C10
+from c10_tools.common import AsyncWriter, FileProgress, PacketCopier, \
+    map_packets
 
 
 class Parser:
@@ -17,7 +18,8 @@ class Parser:
         self.src = src
         self.strip = strip
         self.force = force
-        self.out = open(dst, 'wb')
+        self.out = AsyncWriter(dst)
+        self.copier = PacketCopier(src, self.out)
         self.messages = []
         self.nodes = []
         self.last_root = None
@@ -30,7 +32,7 @@ class Parser:
     def write_node(self):
         """Write an index node packet."""
 
-        offset = self.out.tell()
+        offset = self.copier.tell()
         packet = ComputerF3(
             index_type=1,
             data_type=0x3,
@@ -48,7 +50,7 @@ class Parser:
                 offset=o
             )
             packet.append(m)
-        self.out.write(bytes(packet))
+        self.copier.write(bytes(packet))
         self.messages = []
 
         self.nodes.append((offset, packet))
@@ -56,7 +58,7 @@ class Parser:
     def write_root(self):
         """Generate a root index packet."""
 
-        offset = self.out.tell()
+        offset = self.copier.tell()
         packet = ComputerF3(
             seq=self.get_seq(),
             count=len(self.nodes),
@@ -68,13 +70,13 @@ class Parser:
         )
         for o, node in self.nodes:
             packet.append(packet.Message(ipts=node.rtc, offset=o))
-        self.out.write(bytes(packet))
+        self.copier.write(bytes(packet))
         self.nodes = []
         self.last_root = offset
 
     def main(self):
-        with FileProgress(self.src) as progress:
-            for packet in C10(self.src):
+        with FileProgress(self.src) as progress, self.out, self.copier:
+            for packet in map_packets(self.src):
                 if not self.quiet:
                     progress.update(packet.packet_length)
 
@@ -82,15 +84,15 @@ class Parser:
                 if packet.data_type == 0x03:
                     continue
 
-                # Write data to output file.
-                self.out.write(bytes(packet))
+                # Pass data through to output file unchanged.
+                self.copier.copy(packet.offset, packet.packet_length)
 
                 # Just stripping existing indices so move along.
                 if self.strip:
                     continue
 
                 self.messages.append((
-                    self.out.tell() - packet.packet_length,
+                    self.copier.tell() - packet.packet_length,
                     packet))
 
                 # Projected index node packet size.
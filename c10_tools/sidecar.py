@@ -0,0 +1,245 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import os
+import struct
+
+import numpy as np
+
+from c10_tools.common import Header, open_reader, read_packet, \
+    rtc_seconds, split_file, walk_range
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class Sidecar:
+    """Packet index for a Chapter 10 file, stored next to it as
+    "<file>.c10idx" and keyed on the file's size and modification time.
+    Set SAVE to False (or C10_NO_SIDECAR in the environment) to build
+    indexes in memory only.
+
+    Each column is a numpy array with one value per packet:
+
+    - offset
+    - channel_id
+    - data_type
+    - packet_length
+    - rtc
+    - time (absolute time as seconds since the epoch, NaN until the first
+      time packet)
+
+    "time_errors" counts time packets that couldn't be decoded and were
+    skipped as time references. Indexes with time errors aren't saved.
+    """
+
+    EXTENSION = '.c10idx'
+    SAVE = not os.environ.get('C10_NO_SIDECAR')
+    MAGIC = b'C10IDX01'
+    HEADER = struct.Struct('<8sQqQ')
+    COLUMNS = (
+        ('offset', '<u8', 'Q'),
+        ('channel_id', '<u2', 'H'),
+        ('data_type', 'u1', 'B'),
+        ('packet_length', '<u4', 'I'),
+        ('rtc', '<u8', 'Q'),
+        ('time', '<f8', 'd'),
+    )
+
+    def __init__(self, path, size, mtime, time_errors=0, **columns):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.time_errors = time_errors
+        for name, dtype, _ in self.COLUMNS:
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+
+    def __len__(self):
+        return len(self.offset)
+
+    @classmethod
+    def load(cls, path, build=True, progress=None, jobs=1):
+        """Read the sidecar index for "path" if it's current, otherwise
+        build it (and try to save it, if SAVE is set) if "build" is set. Returns None if
+        there's no usable index. "progress" and "jobs" are passed on to
+        build().
+        """
+
+        stat = os.stat(path)
+        try:
+            with open(path + cls.EXTENSION, 'rb') as f:
+                magic, size, mtime, count = cls.HEADER.unpack(
+                    f.read(cls.HEADER.size))
+                if (magic, size, mtime) == \
+                        (cls.MAGIC, stat.st_size, stat.st_mtime_ns):
+                    columns = {name: np.fromfile(f, dtype, count)
+                               for name, dtype, _ in cls.COLUMNS}
+                    if all(len(col) == count for col in columns.values()):
+                        return cls(path, size, mtime, **columns)
+        except (OSError, struct.error):
+            pass
+
+        if not build:
+            return None
+
+        index = cls.build(path, progress, jobs)
+        if cls.SAVE and not index.time_errors:
+            try:
+                index.save()
+            except OSError:
+                pass
+        return index
+
+    @classmethod
+    def from_c10(cls, c10):
+        """Load the index for the file a C10 object is reading, if it's a
+        local file.
+        """
+
+        path = getattr(getattr(getattr(c10, 'file', None), 'io', None),
+                       'name', None)
+        if isinstance(path, str) and os.path.isfile(path):
+            return cls.load(path)
+
+    @classmethod
+    def build(cls, path, progress=None, jobs=1):
+        """Skim packet headers in "path" and build a new index. Updates
+        "progress" (a FileProgress) if given. With "jobs" > 1 the file is
+        split into byte ranges that are skimmed in parallel.
+        """
+
+        stat = os.stat(path)
+        ranges = split_file(stat.st_size, jobs)
+        if jobs > 1 and len(ranges) > 1:
+            parts = []
+            with ProcessPoolExecutor(jobs) as executor:
+                results = executor.map(
+                    partial(build_range, path, size=stat.st_size), *zip(*ranges))
+                for part, (start, end) in zip(results, ranges):
+                    parts.append(part)
+                    if progress is not None:
+                        progress.update(end - start)
+        else:
+            parts = [build_range(path, 0, stat.st_size, stat.st_size, progress)]
+
+        # Join columns and fill in times for packets that came before the
+        # first time packet in their range.
+        columns = {name: [] for name, _, _ in cls.COLUMNS}
+        last_time, time_errors = None, 0
+        for part, lead, part_time, errors in parts:
+            time_errors += errors
+            part = {name: np.asarray(part[name], dtype)
+                    for name, dtype, _ in cls.COLUMNS}
+            if lead and last_time:
+                part['time'] = part['time'].copy()
+                part['time'][:lead] = [
+                    last_time[0] + rtc_seconds(rtc, last_time[1])
+                    for rtc in part['rtc'][:lead]]
+            last_time = part_time or last_time
+            for name in columns:
+                columns[name].append(part[name])
+
+        columns = {name: np.concatenate(parts)
+                   for name, parts in columns.items()}
+        return cls(path, stat.st_size, stat.st_mtime_ns, time_errors,
+                   **columns)
+
+    def read_packet(self, f, i, parent=None):
+        """Decode the packet at row "i" from file object "f"."""
+
+        offset = int(self.offset[i])
+        f.seek(offset)
+        return read_packet(f, Header(f.read(24), offset), parent)
+
+    def save(self):
+        """Write the index to "<file>.c10idx"."""
+
+        with open(self.path + self.EXTENSION, 'wb') as f:
+            f.write(self.HEADER.pack(
+                self.MAGIC, self.size, self.mtime, len(self)))
+            for name, dtype, _ in self.COLUMNS:
+                f.write(getattr(self, name).astype(dtype).tobytes())
+
+    def get_time(self, i):
+        """Get a datetime for row "i" (or None before the first time
+        packet).
+        """
+
+        if np.isnan(self.time[i]):
+            return None
+        return EPOCH + timedelta(seconds=float(self.time[i]))
+
+    def select(self, channels=(), exclude=(), types=()):
+        """Return a boolean mask of rows matching walk_packets style
+        filters. Channels are compared as strings, as in walk_packets.
+        """
+
+        ids = np.unique(self.channel_id)
+        mask = np.ones(len(self), dtype=bool)
+        if channels:
+            mask &= np.isin(self.channel_id,
+                            [i for i in ids if str(i) in channels])
+        if exclude:
+            mask &= ~np.isin(self.channel_id,
+                             [i for i in ids if str(i) in exclude])
+        if types:
+            mask &= np.isin(self.data_type, types)
+        return mask
+
+    def walk(self, c10, channels=(), exclude=(), types=(), include_time=True):
+        """Yield packets from "c10" the same way walk_packets does, but seek
+        directly to each selected packet instead of reading everything.
+        """
+
+        match = self.select(channels, exclude, types)
+        time = np.zeros(len(self), dtype=bool)
+        if include_time:
+            time = self.data_type == 0x11
+
+        for i in np.flatnonzero(match | time):
+            c10.file.seek(int(self.offset[i]))
+            try:
+                packet = next(c10)
+            except StopIteration:
+                return
+            if time[i]:
+                yield packet
+            if match[i]:
+                yield packet
+
+
+def build_range(path, start, end, size, progress=None):
+    """Build raw index columns for packets in "path" starting within
+    [start, end). Returns a dict of arrays, the number of rows before the
+    first time packet (which have NaN times), (time, rtc) of the last time
+    packet or None, and the number of time packets that couldn't be decoded.
+    """
+
+    columns = {name: array(code) for name, _, code in Sidecar.COLUMNS}
+    time, time_rtc, lead, errors = float('nan'), 0, None, 0
+    with open_reader(path) as f:
+        for header in walk_range(f, start, end, size):
+            if header.data_type == 0x11:
+                try:
+                    packet = read_packet(f, header)
+                    time = (packet.time - EPOCH).total_seconds()
+                    time_rtc = packet.rtc
+                    if lead is None:
+                        lead = len(columns['offset'])
+                except (EOFError, ValueError):
+                    errors += 1
+
+            columns['offset'].append(header.offset)
+            columns['channel_id'].append(header.channel_id)
+            columns['data_type'].append(header.data_type)
+            columns['packet_length'].append(header.packet_length)
+            columns['rtc'].append(header.rtc)
+            columns['time'].append(time + rtc_seconds(header.rtc, time_rtc))
+
+            if progress is not None:
+                progress.update(header.packet_length)
+
+    if lead is None:
+        return columns, len(columns['offset']), None, errors
+    return columns, lead, (time, time_rtc), errors
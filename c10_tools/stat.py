@@ -1,14 +1,21 @@
 
-from contextlib import suppress
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, suppress
+from functools import partial
+from io import StringIO
 from urllib.parse import urlparse
 import os
 
 from termcolor import colored
 import click
+import numpy as np
 import s3fs
 
-from c10_tools.common import C10, FileProgress, fmt_number, fmt_size, \
-    fmt_table, walk_packets
+from c10_tools.common import FileProgress, PacketView, TimeRef, \
+    fmt_number, fmt_size, fmt_table, get_time, ms1553_offsets, \
+    open_reader, parse_filters, read_packet, split_file, walk_headers, \
+    walk_packets, walk_range
+from c10_tools.sidecar import Sidecar
 
 
 TYPES = (
@@ -32,14 +39,17 @@ TYPES = (
 
 
 class Stat:
-    def __init__(self, filename, channel, exclude, type, verbose, quiet):
+    def __init__(self, filename, channel, exclude, type, verbose, quiet,
+                 jobs=1):
         self.filename = filename
         self.channel = channel
         self.exclude = exclude
         self.type = type
         self.verbose = verbose
         self.quiet = quiet
+        self.jobs = jobs
         self.channels, self.start_time = {}, 0
+        self.last_time, self.last_rtc = None, None
 
     def parse(self):
         try:
@@ -64,53 +74,25 @@ class Stat:
             f = fs.open(path.path[1:])
             size = fs.du(path.path[1:])
         else:
-            f = open(self.filename, 'rb')
             size = os.stat(self.filename).st_size
 
-        # Walk through packets and track counts.
+            # Non-verbose summaries come straight from the sidecar index.
+            if not self.verbose:
+                with FileProgress(total=size, disable=self.quiet) as progress:
+                    index = Sidecar.load(self.filename, progress=progress,
+                                         jobs=self.jobs)
+                self.scan_index(index)
+                return
+
+            elif self.jobs > 1:
+                self.scan_parallel(size)
+                return
+
+            f = open_reader(self.filename)
+
         with FileProgress(total=size, disable=self.quiet) as progress, suppress(KeyboardInterrupt):
             try:
-                args = {
-                    '--channel': self.channel,
-                    '--type': self.type,
-                    '--exclude': self.exclude
-                }
-                for packet in walk_packets(C10(f), args):
-                    if not self.start_time and packet.data_type == 0x11:
-                        self.start_time = packet
-                    key = (packet.channel_id, packet.data_type)
-                    if key not in self.channels:
-                        self.channels[key] = {'packets': 1,
-                                              'size': packet.packet_length,
-                                              'type': packet.data_type,
-                                              'id': packet.channel_id,
-                                              '1553_errors': [0, 0, 0],
-                                              '1553_commands': set(),
-                                              'events': {}}
-                    else:
-                        self.channels[key]['packets'] += 1
-                        self.channels[key]['size'] += packet.packet_length
-
-                    if self.verbose:
-                        # Track 1553 error counts and command words
-                        if packet.data_type == 0x19:
-                            for msg in packet:
-                                self.channels[key]['1553_commands'].add(
-                                    f'{msg.data[0]:0x}'.zfill(2) + f'{msg.data[1]:0x}'.zfill(2))
-                                for i, err in enumerate(('le', 'se', 'we')):
-                                    err = getattr(msg, err)
-                                    self.channels[key]['1553_errors'][i] += err
-
-                        # Record events
-                        elif packet.data_type == 0x2:
-                            event_list = self.channels[key]['events']
-                            for event in packet:
-                                if event.number not in event_list:
-                                    event_list[event.number] = 1
-                                else:
-                                    event_list[event.number] += 1
-
-                    progress.update(packet.packet_length)
+                self.scan_headers(f, walk_headers(f, size), progress)
 
             except Exception as err:
                 print(f'Failed to read file {self.filename} at offset \
@@ -120,10 +102,181 @@ class Stat:
             finally:
                 f.close()
 
-        try:
-            self.end_time = packet.get_time()
-        except UnboundLocalError:
-            self.end_time = None
+        self.end_time = None
+        if self.last_rtc is not None:
+            self.end_time = get_time(self.last_rtc, self.last_time)
+
+    def scan_headers(self, f, headers, progress=None):
+        """Track counts (and 1553/event details if verbose) for packet
+        headers from "headers", reading from "f" only for packets we need to
+        look inside of.
+        """
+
+        args = {
+            '--channel': self.channel,
+            '--type': self.type,
+            '--exclude': self.exclude
+        }
+        time_offset = None
+        for header in walk_packets(headers, args):
+            packet = header
+            if header.data_type == 0x11:
+                if header.offset != time_offset:
+                    packet = read_packet(f, header)
+                    self.last_time = TimeRef(packet)
+                    time_offset = header.offset
+                if not self.start_time:
+                    self.start_time = self.last_time
+            elif self.verbose and header.data_type == 0x19:
+                f.seek(header.offset)
+                packet = PacketView(f.read(header.packet_length))
+            elif self.verbose and header.data_type == 0x2:
+                packet = read_packet(f, header)
+
+            key = (packet.channel_id, packet.data_type)
+            if key not in self.channels:
+                self.channels[key] = {'packets': 1,
+                                      'size': packet.packet_length,
+                                      'type': packet.data_type,
+                                      'id': packet.channel_id,
+                                      '1553_errors': [0, 0, 0],
+                                      '1553_commands': set(),
+                                      'events': {}}
+            else:
+                self.channels[key]['packets'] += 1
+                self.channels[key]['size'] += packet.packet_length
+
+            if self.verbose:
+                # Track 1553 error counts and command words
+                if packet.data_type == 0x19:
+                    self.scan_1553(self.channels[key], packet)
+
+                # Record events
+                elif packet.data_type == 0x2:
+                    event_list = self.channels[key]['events']
+                    for event in packet:
+                        if event.number not in event_list:
+                            event_list[event.number] = 1
+                        else:
+                            event_list[event.number] += 1
+
+            self.last_rtc = header.rtc
+            if progress is not None:
+                progress.update(packet.packet_length)
+
+    def scan_1553(self, channel, packet):
+        """Add command words and error counts from a 1553 PacketView to
+        "channel", a whole packet at a time.
+        """
+
+        raw = np.frombuffer(packet.data, dtype=np.uint8)
+        offsets = ms1553_offsets(packet)
+
+        # Length, sync, and word errors from the block status word.
+        status = raw[offsets + 8]
+        for i, mask in enumerate((0x20, 0x10, 0x08)):
+            channel['1553_errors'][i] += int(np.count_nonzero(status & mask))
+
+        # Command word is the first data word (shown as stored).
+        lengths = raw[offsets + 12] | (raw[offsets + 13].astype(np.uint16) << 8)
+        offsets = offsets[lengths >= 2] + 14
+        commands = (raw[offsets].astype(np.uint16) << 8) | raw[offsets + 1]
+        channel['1553_commands'].update(
+            f'{command:04x}' for command in np.unique(commands).tolist())
+
+    def scan_parallel(self, size):
+        """Split the file into byte ranges and scan them in worker
+        processes, merging results in file order.
+        """
+
+        ranges = split_file(size, self.jobs)
+        worker = Stat(self.filename, self.channel, self.exclude, self.type,
+                      self.verbose, True)
+        with FileProgress(total=size, disable=self.quiet) as progress, \
+                ProcessPoolExecutor(self.jobs) as executor:
+            try:
+                results = executor.map(partial(scan_range, worker, size=size),
+                                       *zip(*ranges))
+                for part, (start, end) in zip(results, ranges):
+                    self.merge(part)
+                    progress.update(end - start)
+            except Exception as err:
+                print(f'Failed to read file {self.filename} with \
+{err.__class__.__name__}: {err}')
+                raise
+
+        self.end_time = None
+        if self.last_rtc is not None:
+            self.end_time = get_time(self.last_rtc, self.last_time)
+
+    def merge(self, other):
+        """Add results from a later range of the same file."""
+
+        for key, channel in other.channels.items():
+            if key not in self.channels:
+                self.channels[key] = channel
+                continue
+            ours = self.channels[key]
+            ours['packets'] += channel['packets']
+            ours['size'] += channel['size']
+            ours['1553_errors'] = [a + b for a, b in zip(
+                ours['1553_errors'], channel['1553_errors'])]
+            ours['1553_commands'] |= channel['1553_commands']
+            for event, count in channel['events'].items():
+                ours['events'][event] = ours['events'].get(event, 0) + count
+
+        self.start_time = self.start_time or other.start_time
+        self.last_time = other.last_time or self.last_time
+        if other.last_rtc is not None:
+            self.last_rtc = other.last_rtc
+
+    def scan_index(self, index):
+        """Count packets and data size per channel from a sidecar index
+        without reading the file (except for time packets).
+        """
+
+        channels, exclude, types = parse_filters({
+            '--channel': self.channel,
+            '--type': self.type,
+            '--exclude': self.exclude,
+        })
+
+        # Rows in the order walk_packets would yield them (time packets are
+        # always included).
+        time = np.flatnonzero(index.data_type == 0x11)
+        rows = np.concatenate((
+            time, np.flatnonzero(index.select(channels, exclude, types))))
+        self.end_time = None
+        if not len(rows):
+            return
+
+        keys = (index.channel_id[rows].astype(np.uint32) << 8) | \
+            index.data_type[rows]
+        keys, inverse, counts = np.unique(
+            keys, return_inverse=True, return_counts=True)
+        sizes = np.bincount(inverse, weights=index.packet_length[rows])
+        for key, count, size in zip(
+                keys.tolist(), counts.tolist(), sizes.tolist()):
+            self.channels[(key >> 8, key & 0xff)] = {
+                'packets': count,
+                'size': int(size),
+                'type': key & 0xff,
+                'id': key >> 8,
+                '1553_errors': [0, 0, 0],
+                '1553_commands': set(),
+                'events': {}}
+
+        # Start time from the first time packet and end time from the last
+        # packet relative to the most recent time packet.
+        last = rows.max()
+        last_time = None
+        with open(self.filename, 'rb') as f:
+            if len(time):
+                self.start_time = index.read_packet(f, time[0])
+                previous = time[time <= last]
+                if len(previous):
+                    last_time = index.read_packet(f, previous[-1])
+        self.end_time = get_time(int(index.rtc[last]), last_time)
 
     def file_summary(self):
         """Summarize channels and the file as a whole."""
@@ -180,18 +333,56 @@ class Stat:
     Size: {fmt_size(size):>21}     Duration:{duration:>27}\n''')
 
 
+def scan_range(stats, start, end, size):
+    """Scan packets starting within [start, end) of a file into "stats" (a
+    fresh Stat object) in a worker process and return it.
+    """
+
+    with open_reader(stats.filename) as f:
+        stats.scan_headers(f, walk_range(f, start, end, size))
+    return stats
+
+
+def run_stat(filename, **kwargs):
+    """Scan and summarize a single file in a worker process, returning the
+    output instead of printing it so results can be printed in order.
+    """
+
+    out = StringIO()
+    with redirect_stdout(out):
+        Stat(filename, **kwargs).parse()
+    return out.getvalue()
+
+
 @click.command()
 @click.argument('file', nargs=-1)
 @click.option('-c', '--channel', type=str, help='Specify channels (comma-separated) to include')
 @click.option('-e', '--exclude', type=str, help='Specify channels (comma-separated) to exclude')
 @click.option('-t', '--type', type=str, help='Specify datatypes (comma-separated) to include')
+@click.option('-j', '--jobs', default=1, help='Number of worker processes (per file, or split within a single file)')
 @click.pass_context
-def stat(ctx, file, channel, exclude, type):
+def stat(ctx, file, channel, exclude, type, jobs):
     """Inspect one or more Chapter 10 files and get channel info."""
 
     ctx.ensure_object(dict)
 
+    # Scan files in worker processes (without per-file progress bars) and
+    # print summaries in the original order.
+    if jobs > 1 and len(file) > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            summaries = executor.map(partial(
+                run_stat,
+                channel=channel,
+                exclude=exclude,
+                type=type,
+                verbose=ctx.obj.get('verbose'),
+                quiet=True), file)
+            for summary in summaries:
+                print(summary, end='')
+        return
+
     for filename in file:
         stats = Stat(filename, channel, exclude, type,
-                     verbose=ctx.obj.get('verbose'), quiet=ctx.obj.get('quiet'))
+                     verbose=ctx.obj.get('verbose'), quiet=ctx.obj.get('quiet'),
+                     jobs=jobs)
         stats.parse()
@@ -0,0 +1,242 @@
+
+import ipaddress
+import socket
+import struct
+
+from c10_tools.common import Header, PacketView
+
+
+def udp_socket(host, port, buffer_size=1 << 24):
+    """Open a UDP socket bound to "port" with a large receive buffer. If
+    "host" (an address or hostname) is a multicast group it's joined on all
+    interfaces.
+    """
+
+    if host:
+        host = socket.gethostbyname(host)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+    if host and ipaddress.ip_address(host).is_multicast:
+        sock.bind(('', port))
+        sock.setsockopt(
+            socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+            struct.pack('4sl', socket.inet_aton(host), socket.INADDR_ANY))
+    else:
+        sock.bind((host or '', port))
+    return sock
+
+
+class StreamParser:
+    """Incremental packet parser for network streams. feed() takes chunks of
+    bytes as they arrive and returns complete packets (as PacketViews) as
+    soon as they're available. Packets are consumed by header length after
+    checking the header, bad headers are skipped by resyncing, and consumed
+    bytes are never rescanned. The buffer only ever holds one incomplete
+    packet.
+    """
+
+    # Largest packet we'll wait for (max body plus headers and filler).
+    MAX_PACKET = 524288 + 64
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.needed = 0
+        self.invalid = 0
+        self.skipped = 0
+
+    def feed(self, data):
+        """Add "data" to the buffer and return a list of complete packets."""
+
+        buf = self.buf
+        buf += data
+        if len(buf) < self.needed:
+            return []
+
+        packets = []
+        pos = 0
+        with memoryview(buf) as view:
+            while len(buf) - pos >= 24:
+
+                # Skip to the next sync pattern.
+                if view[pos:pos + 2] != b'\x25\xeb':
+                    sync = buf.find(b'\x25\xeb', pos)
+                    if sync < 0:
+                        sync = len(buf) - 1
+                    self.skipped += sync - pos
+                    pos = sync
+                    continue
+
+                header = Header(bytes(view[pos:pos + 24]))
+                if not header.validate(True) or \
+                        header.packet_length > self.MAX_PACKET:
+                    self.invalid += 1
+                    self.skipped += 1
+                    pos += 1
+                    continue
+
+                # Wait for the rest of the packet.
+                end = pos + header.packet_length
+                if end > len(buf):
+                    break
+
+                packets.append(PacketView(memoryview(bytes(view[pos:end]))))
+                pos = end
+
+        # Drop consumed bytes and note how much we need before trying again.
+        del buf[:pos]
+        self.needed = 24
+        if len(buf) >= 24 and buf[:2] == b'\x25\xeb':
+            self.needed = Header(bytes(buf[:24])).packet_length
+        return packets
+
+
+class TransferDecoder:
+    """Unwrap the UDP transfer header (format 1) from network Chapter 10.
+    Datagrams are put back in sequence order using a bounded reorder window
+    and segmented packets are reassembled. feed() takes each datagram with
+    its arrival time and returns a list of (bytes, arrival time) ready for a
+    StreamParser, where a reassembled packet arrived with its last segment.
+    Nothing is released until the window
+    first fills (or flush() is called) so the start of the sequence can be
+    found. Datagrams with other header versions just have the 4 byte header
+    removed.
+
+    Counts kept:
+
+    - lost: datagrams never seen (skipped once the window filled)
+    - late: duplicate or too-late datagrams that were ignored
+    - incomplete: partly reassembled packets abandoned after a missing
+      segment
+    """
+
+    def __init__(self, window=64):
+        self.window = window
+        self.expected = None
+        self.pending = {}
+        self.segments = {}
+        self.lost, self.late, self.incomplete = 0, 0, 0
+
+    def feed(self, datagram, arrival=None):
+        """Add one datagram and return any data now available in order."""
+
+        if len(datagram) < 4:
+            return []
+        if datagram[0] & 0xf != 1:
+            return [(datagram[4:], arrival)]
+
+        seq = int.from_bytes(datagram[1:4], 'little')
+        if seq in self.pending or self.expected is not None and \
+                (seq - self.expected) & 0xffffff >= 0x800000:
+            self.late += 1
+            return []
+        self.pending[seq] = datagram, arrival
+        return self.release()
+
+    def flush(self):
+        """Release everything held for reordering (at the end of input)."""
+
+        return self.release(True)
+
+    def release(self, force=False):
+        """Unwrap datagrams that are next in sequence. Skip over missing
+        ones once the window is full (or if "force" is set).
+        """
+
+        out = []
+        if self.expected is None:
+            # Fill the window before picking where the sequence starts.
+            if not self.pending or not force and \
+                    len(self.pending) <= self.window:
+                return out
+            first = next(iter(self.pending))
+            self.expected = min(
+                self.pending,
+                key=lambda s: (s - first + 0x800000) & 0xffffff)
+        while self.pending:
+            if self.expected not in self.pending:
+                if not force and len(self.pending) <= self.window:
+                    break
+                nearest = min(self.pending,
+                              key=lambda s: (s - self.expected) & 0xffffff)
+                self.lost += (nearest - self.expected) & 0xffffff
+                self.expected = nearest
+            datagram, arrival = self.pending.pop(self.expected)
+            self.expected = (self.expected + 1) & 0xffffff
+            out += [(data, arrival) for data in self.unwrap(datagram)]
+        return out
+
+    def unwrap(self, datagram):
+        """Return the Chapter 10 data in a datagram, reassembling segmented
+        packets.
+        """
+
+        # Full packets
+        if not datagram[0] >> 4:
+            return [datagram[4:]]
+
+        # Segmented packet: channel ID, channel sequence number, and offset
+        # of this segment within the packet.
+        if len(datagram) < 12:
+            return []
+        channel_id, channel_seq = struct.unpack_from('<HB', datagram, 4)
+        offset, = struct.unpack_from('<I', datagram, 8)
+        partial = self.segments.pop(channel_id, None)
+        if offset == 0:
+            if partial is not None:
+                self.incomplete += 1
+            partial = (channel_seq, bytearray())
+        elif partial is None:
+            return []
+        elif partial[0] != channel_seq or len(partial[1]) != offset:
+            self.incomplete += 1
+            return []
+
+        packet = partial[1]
+        packet += datagram[12:]
+        if len(packet) >= 24:
+            length, = struct.unpack_from('<I', packet, 4)
+            if len(packet) >= length:
+                return [bytes(packet[:length])]
+        self.segments[channel_id] = partial
+        return []
+
+
+class TransferDemux:
+    """Keep a TransferDecoder per source (e.g. sender address or UDP ports)
+    so streams from different recorders don't mix up each other's sequence
+    numbers. feed() and flush() work as for a single decoder; the counts
+    are totals over every source.
+    """
+
+    def __init__(self, window=64):
+        self.window = window
+        self.decoders = {}
+
+    def feed(self, datagram, arrival=None, source=None):
+        decoder = self.decoders.get(source)
+        if decoder is None:
+            decoder = self.decoders[source] = TransferDecoder(self.window)
+        return decoder.feed(datagram, arrival)
+
+    def flush(self):
+        out = []
+        for decoder in self.decoders.values():
+            out += decoder.flush()
+        return out
+
+    @property
+    def pending(self):
+        return any(decoder.pending for decoder in self.decoders.values())
+
+    @property
+    def lost(self):
+        return sum(decoder.lost for decoder in self.decoders.values())
+
+    @property
+    def late(self):
+        return sum(decoder.late for decoder in self.decoders.values())
+
+    @property
+    def incomplete(self):
+        return sum(decoder.incomplete for decoder in self.decoders.values())
@@ -1,78 +1,215 @@
 
-import socket
+from collections import deque
+import asyncio
+import sys
 
-import matplotlib.pyplot as plt
 import click
 
-from c10_tools.common import C10
-
-
-class Parser:
-
-    def __init__(self, buffer_size=100000):
-        self.buffer_size = buffer_size
-        self.buf = bytes()
-
-    def parse(self, data):
-        """Take a bytes object and attempt to parse chapter 10 data into db."""
-
-        # Limit the buffer size and add new data to the buffer.
-        self.buf = self.buf[-self.buffer_size:] + data
-
-        sync_count = self.buf.count(b'\x25\xeb')
-        for i in range(sync_count):
-
-            sync = self.buf.find(b'\x25\xeb')
-            if sync < 0:
-                break
-
-            try:
-                for packet in C10.from_string(self.buf[sync:]):
-                    yield packet
-                continue
-            except:
-                pass
-
-            if i < (sync_count - 2):
-                self.buf = self.buf[sync + 2:]
+from c10_tools.common import fmt_size
+from c10_tools.stream import StreamParser, TransferDemux, udp_socket
+
+
+class RateBins:
+    """Bytes received per channel in fixed-width time bins. Only the last
+    "count" closed bins are kept (as history of (end time, {channel: bytes
+    per second})).
+    """
+
+    def __init__(self, width=1.0, count=100):
+        self.width = width
+        self.history = deque(maxlen=count)
+        self.unseen = deque(maxlen=count)
+        self.channels = set()
+        self.current = {}
+        self.start, self.index = None, 0
+
+    def add(self, channel_id, length, now):
+        self.roll(now)
+        self.current[channel_id] = self.current.get(channel_id, 0) + length
+
+    def roll(self, now):
+        """Close any bins that ended by "now"."""
+
+        if self.start is None:
+            self.start = now
+        while now >= self.start + (self.index + 1) * self.width:
+            self.index += 1
+            rates = {channel_id: length / self.width
+                     for channel_id, length in self.current.items()}
+            self.channels.update(rates)
+            self.history.append((self.index * self.width, rates))
+            self.unseen.append((self.index * self.width, rates))
+            self.current = {}
+
+            # Skip over long idle periods.
+            idle = int((now - self.start) / self.width) - self.index
+            if idle > self.history.maxlen:
+                self.index += idle
+
+    def closed(self):
+        """Return the bins closed since the last call."""
+
+        closed = list(self.unseen)
+        self.unseen.clear()
+        return closed
+
+
+class StreamProtocol(asyncio.DatagramProtocol):
+    """Parse Chapter 10 from datagrams as they arrive and pass each packet
+    (in "channels" if given) to handler(packet, arrival time). A packet's
+    arrival time is that of the datagram that completed it, even if it was
+    held for reordering. Handlers should only count things so rendering
+    can't hold up the socket.
+    """
+
+    def __init__(self, handler, channels=None):
+        self.handler = handler
+        self.channels = channels
+        self.transfer = TransferDemux()
+        self.parser = StreamParser()
+        self.last_arrival = None
+
+    def datagram_received(self, data, addr):
+        now = asyncio.get_running_loop().time()
+        self.last_arrival = now
+        self.parse(self.transfer.feed(data, now, addr))
+
+    def flush(self):
+        """Parse anything the transfer decoder is holding for reordering."""
+
+        self.parse(self.transfer.flush())
+
+    def parse(self, chunks):
+        for chunk, arrival in chunks:
+            for packet in self.parser.feed(chunk):
+                if self.channels and packet.channel_id not in self.channels:
+                    continue
+                self.handler(packet, arrival)
+
+
+class TextRenderer:
+    """Print each closed bin as a line of per-channel rates (or CSV rows)."""
+
+    def __init__(self, csv=False, out=None):
+        self.csv = csv
+        self.out = out = out or sys.stdout
+        if csv:
+            print('time,channel_id,bytes_per_second', file=out)
+
+    def update(self, bins, closed):
+        for end, rates in closed:
+            if self.csv:
+                for channel_id in sorted(rates):
+                    print(f'{end:.3f},{channel_id},{rates[channel_id]:.1f}',
+                          file=self.out)
+            else:
+                print(f'{end:10.3f}s  ' + '  '.join(
+                    f'{channel_id}: {fmt_size(rates[channel_id])}/s'
+                    for channel_id in sorted(rates)), file=self.out)
+        self.out.flush()
+
+
+class PlotRenderer:
+    """Live plot of per-channel rates. Requires matplotlib."""
+
+    def __init__(self):
+        import matplotlib.pyplot as plt
+
+        self.fig, self.ax = plt.subplots()
+        self.ax.set_xlabel('Seconds')
+        self.ax.set_ylabel('Bytes per second')
+        self.lines = {}
+        plt.show(block=False)
+
+    def update(self, bins, closed):
+        if closed:
+            times = [end for end, _ in bins.history]
+            for channel_id in sorted(bins.channels):
+                values = [rates.get(channel_id, 0)
+                          for _, rates in bins.history]
+                if channel_id not in self.lines:
+                    self.lines[channel_id], = self.ax.plot(
+                        [], [], label=f'Channel {channel_id}')
+                    self.ax.legend(loc='upper left')
+                self.lines[channel_id].set_data(times, values)
+            self.ax.relim()
+            self.ax.autoscale_view()
+            self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+
+async def watch(sock, protocol, refresh, fps=10.0, duration=None):
+    """Receive from "sock" into "protocol" (a StreamProtocol) and call
+    refresh(now) "fps" times a second until cancelled or "duration" seconds
+    pass. Datagrams held for reordering are released whenever nothing has
+    arrived for a refresh interval.
+    """
+
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: protocol, sock=sock)
+    try:
+        start = loop.time()
+        refresh(start)
+        while duration is None or loop.time() - start < duration:
+            await asyncio.sleep(1 / fps)
+            now = loop.time()
+            if protocol.transfer.pending and \
+                    now - protocol.last_arrival >= 1 / fps:
+                protocol.flush()
+            refresh(now)
+    finally:
+        transport.close()
+        protocol.flush()
+
+
+async def monitor(sock, bins, renderer, channels=None, fps=10.0,
+                  duration=None):
+    """Count channel data rates from "sock" into "bins" and refresh
+    "renderer" "fps" times a second.
+    """
+
+    def refresh(now):
+        bins.roll(now)
+        renderer.update(bins, bins.closed())
+
+    protocol = StreamProtocol(
+        lambda packet, now: bins.add(packet.channel_id, packet.data_length,
+                                     now), channels)
+    await watch(sock, protocol, refresh, fps, duration)
 
 
 @click.command()
 @click.argument('dsthost')
 @click.argument('dstport', type=int)
-@click.argument('channel')
+@click.argument('channel', type=str, required=False)
+@click.option('-o', '--output', type=click.Choice(['plot', 'text', 'csv']), default='plot', show_default=True, help='Live plot (requires matplotlib) or headless text/CSV')
+@click.option('-b', '--bin', 'width', type=float, default=1.0, show_default=True, help='Seconds per rate bin')
+@click.option('--fps', type=float, default=10.0, show_default=True, help='Display refresh rate')
+@click.option('-d', '--duration', type=float, help='Stop after this many seconds')
 @click.pass_context
-def streamcheck(ctx, dsthost, dstport, channel):
-    """Plot data density of a channel in a Chapter 10 stream. Requires matplotlib."""
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((dsthost, dstport))
-
-    parser = Parser()
-    last_rtc = 0
-
-    maxlength = 100
-    plot = [0 for i in range(maxlength)]
-    fig = plt.figure()
-    ax1 = fig.add_subplot(1, 1, 1)
-
-    while True:
+def streamcheck(ctx, dsthost, dstport, channel=None, output='plot', width=1.0,
+                fps=10.0, duration=None):
+    """Show data rates of channels (comma-separated, default all) in a
+    Chapter 10 stream. Plotting requires matplotlib.
+    """
+
+    channels = channel and {int(c) for c in channel.split(',')}
+    if output == 'plot':
         try:
-            raw, addr = sock.recvfrom(1048576)
-            for packet in parser.parse(raw[4:]):
-
-                if packet.channel_id == channel:
-                    offset = (packet.rtc - last_rtc) & 0xffffffffffff
-                    seconds = offset / 10_000_000
-                    if not seconds:
-                        continue
-                    last_rtc = packet.rtc
-                    density = packet.data_length / seconds
-                    plot.append(density)
-                    plot = plot[-maxlength:]
-                    ax1.clear()
-                    ax1.plot(range(len(plot)), plot)
-                    plt.pause(0.1)
-        except KeyboardInterrupt:
-            print('Stopped')
-            break
+            renderer = PlotRenderer()
+        except ImportError:
+            print('Plotting requires matplotlib. Use -o text or -o csv.')
+            raise SystemExit
+    else:
+        renderer = TextRenderer(output == 'csv')
+
+    sock = udp_socket(dsthost, dstport)
+    sock.setblocking(False)
+    bins = RateBins(width)
+    try:
+        asyncio.run(monitor(sock, bins, renderer, channels, fps, duration))
+    except KeyboardInterrupt:
+        print('Stopped')
+    finally:
+        sock.close()
@@ -4,7 +4,8 @@ import os
 
 import click
 
-from c10_tools.common import FileProgress, C10
+from c10_tools.common import AsyncWriter, FileProgress, PacketCopier, \
+    map_packets
 
 
 def valid(timestamp, previous):
@@ -34,13 +35,19 @@ def timefix(ctx, infile, outfile, force=False):
         raise SystemExit
 
     last_time = None
-    with FileProgress(infile, disable=ctx.obj.get('quiet')) as progress, open(outfile, 'wb') as out_f:
-        for packet in C10(infile):
+    with FileProgress(infile, disable=ctx.obj.get('quiet')) as progress, AsyncWriter(outfile) as out_f, \
+            PacketCopier(infile, out_f) as copier:
+        for packet in map_packets(infile):
             progress.update(packet.packet_length)
 
+            # Only re-encode time packets that need fixing.
             if packet.data_type == 0x11:
-                if not valid(packet.time, last_time):
-                    packet.time = last_time + timedelta(seconds=1)
-                last_time = packet.time
-
-            out_f.write(bytes(packet))
\ No newline at end of file
+                time_packet = packet.decode()
+                if not valid(time_packet.time, last_time):
+                    time_packet.time = last_time + timedelta(seconds=1)
+                    last_time = time_packet.time
+                    copier.write(bytes(time_packet))
+                    continue
+                last_time = time_packet.time
+
+            copier.copy(packet.offset, packet.packet_length)
\ No newline at end of file
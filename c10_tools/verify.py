@@ -0,0 +1,190 @@
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+
+import click
+
+from c10_tools.common import FileProgress, find_c10, fmt_number, fmt_table, \
+    map_packets
+from c10_tools.timefix import valid
+
+
+class ChannelCheck:
+    """Continuity counts for one channel."""
+
+    __slots__ = ('packets', 'gaps', 'missing', 'rtc_backwards',
+                 'checksum_errors', 'time_errors', 'sequence', 'rtc',
+                 'time')
+
+    def __init__(self):
+        self.packets, self.gaps, self.missing = 0, 0, 0
+        self.rtc_backwards, self.checksum_errors, self.time_errors = 0, 0, 0
+        self.sequence = self.rtc = self.time = None
+
+    @property
+    def problems(self):
+        return self.gaps + self.rtc_backwards + self.checksum_errors + \
+            self.time_errors
+
+
+class Verify:
+    """Skim packet headers in a file and check sequence numbers, RTC order,
+    time packet spacing, and (unless "checksums" is False) data checksums.
+    Bytes skipped over between packets and a truncated final packet are
+    counted too. If "detail" is set each problem is also recorded in
+    "issues" as (offset, channel ID, description).
+    """
+
+    def __init__(self, path, checksums=True, detail=False, progress=None):
+        self.path = path
+        self.checksums = checksums
+        self.detail = detail
+        self.progress = progress
+        self.channels = {}
+        self.issues = []
+        self.skipped, self.truncated = 0, 0
+
+    @property
+    def problems(self):
+        return sum(c.problems for c in self.channels.values()) + \
+            bool(self.skipped) + bool(self.truncated)
+
+    def issue(self, packet, description):
+        if self.detail:
+            self.issues.append((packet.offset, packet.channel_id, description))
+
+    def run(self):
+        expected = 0
+        for packet in map_packets(self.path):
+            if packet.offset != expected:
+                self.skipped += packet.offset - expected
+                if self.detail:
+                    self.issues.append((expected, None, 'Skipped %s bytes' %
+                                        fmt_number(packet.offset - expected)))
+            expected = packet.offset + packet.packet_length
+            if self.progress is not None:
+                self.progress.update(expected - self.progress.n)
+            self.check(packet)
+
+        size = os.stat(self.path).st_size
+        if expected < size:
+            self.truncated = size - expected
+            if self.detail:
+                self.issues.append((expected, None, 'Truncated final %s bytes'
+                                    % fmt_number(self.truncated)))
+        return self
+
+    def check(self, packet):
+        channel = self.channels.get(packet.channel_id)
+        if channel is None:
+            channel = self.channels[packet.channel_id] = ChannelCheck()
+        channel.packets += 1
+
+        if channel.sequence is not None:
+            skipped = (packet.sequence_number - channel.sequence - 1) & 0xff
+            if skipped:
+                channel.gaps += 1
+                channel.missing += skipped
+                self.issue(packet, 'Sequence %s after %s' % (
+                    packet.sequence_number, channel.sequence))
+        channel.sequence = packet.sequence_number
+
+        # RTC is 48 bits, so compare the wrapped difference. Computer
+        # generated packets (index etc.) may refer back to earlier RTCs.
+        if packet.data_type > 0x07:
+            if channel.rtc is not None and \
+                    (packet.rtc - channel.rtc) & 0xffffffffffff >= 1 << 47:
+                channel.rtc_backwards += 1
+                self.issue(packet, 'RTC went backwards by %s' % fmt_number(
+                    (channel.rtc - packet.rtc) & 0xffffffffffff))
+            channel.rtc = packet.rtc
+
+        if self.checksums and not packet.checksum_valid():
+            channel.checksum_errors += 1
+            self.issue(packet, 'Data checksum mismatch')
+
+        if packet.data_type == 0x11:
+            try:
+                time = packet.decode().time
+            except Exception as err:
+                channel.time_errors += 1
+                self.issue(packet, f'Unreadable time packet ({err})')
+                return
+            if not valid(time, channel.time):
+                channel.time_errors += 1
+                self.issue(packet, f'Time {time} after {channel.time}')
+            channel.time = time
+
+    def report(self):
+        """Return a summary (and any detail lines) as a string."""
+
+        lines = [f'Verifying {self.path}']
+        for offset, channel_id, description in self.issues:
+            channel = '' if channel_id is None else f'channel {channel_id} '
+            lines.append(f'    {offset:>14,}  {channel}{description}')
+
+        table = [('Channel ID', 'Packets', 'Sequence gaps', 'Missing',
+                  'RTC backwards', 'Checksum errors', 'Time errors')]
+        for channel_id in sorted(self.channels):
+            channel = self.channels[channel_id]
+            table.append((f'Channel {channel_id:2}',
+                          fmt_number(channel.packets),
+                          fmt_number(channel.gaps),
+                          fmt_number(channel.missing),
+                          fmt_number(channel.rtc_backwards),
+                          fmt_number(channel.checksum_errors),
+                          fmt_number(channel.time_errors)))
+        if len(table) > 1:
+            lines.append(fmt_table(table))
+        if self.skipped:
+            lines.append(f'Skipped {fmt_number(self.skipped)} bytes between '
+                         'packets')
+        if self.truncated:
+            lines.append(f'Truncated final packet ({fmt_number(self.truncated)}'
+                         ' bytes)')
+        lines.append(f'{fmt_number(self.problems)} problems found'
+                     if self.problems else 'OK')
+        return '\n'.join(lines) + '\n'
+
+
+def run_verify(path, checksums=True, detail=False):
+    """Verify one file (in a worker process) and return (problems,
+    report).
+    """
+
+    result = Verify(path, checksums, detail).run()
+    return result.problems, result.report()
+
+
+@click.command()
+@click.argument('file', nargs=-1)
+@click.option('-s', '--skim', is_flag=True, help='Only check headers (skip data checksums)')
+@click.option('-j', '--jobs', default=1, help='Number of files to check in parallel')
+@click.pass_context
+def verify(ctx, file, skim=False, jobs=1):
+    """Check sequence numbers, RTC order, time packet spacing, and checksums
+    in Chapter 10 files. Exits with status 1 if any problems are found. Use
+    -v for the location of each problem.
+    """
+
+    ctx.ensure_object(dict)
+    detail = bool(ctx.obj.get('verbose'))
+
+    problems = 0
+    paths = list(find_c10(file))
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            for count, report in executor.map(partial(
+                    run_verify, checksums=not skim, detail=detail), paths):
+                problems += count
+                print(report)
+    else:
+        for path in paths:
+            with FileProgress(path, disable=ctx.obj.get('quiet')) as progress:
+                result = Verify(path, not skim, detail, progress).run()
+            problems += result.problems
+            print(result.report())
+
+    if problems:
+        ctx.exit(1)
@@ -1,6 +1,8 @@
 
 from unittest.mock import patch
 import os
+import shutil
+import tempfile
 
 from chapter10 import C10
 
@@ -10,13 +12,24 @@ TESTDIR = os.path.join(os.path.dirname(__file__), 'tests')
 
 
 def pytest_configure():
-    pytest.SAMPLE = os.path.join(TESTDIR, '1.c10')
-    pytest.EVENTS = os.path.join(TESTDIR, 'event.c10')
-    pytest.ETHERNET = os.path.join(TESTDIR, 'ethernet.c10')
-    pytest.ERR = os.path.join(TESTDIR, 'err.c10')
-    pytest.BAD = os.path.join(TESTDIR, 'bad.c10')
-    pytest.PCAP = os.path.join(TESTDIR, 'test.pcap')
-    pytest.TMATS = os.path.join(TESTDIR, 'test.tmt')
+
+    # Work on copies so sidecar indexes aren't left in the tests directory.
+    pytest.DATADIR = datadir = tempfile.mkdtemp()
+    for name in ('1.c10', 'event.c10', 'ethernet.c10', 'err.c10', 'bad.c10',
+                 'test.pcap', 'test.tmt'):
+        shutil.copy2(os.path.join(TESTDIR, name), datadir)
+
+    pytest.SAMPLE = os.path.join(datadir, '1.c10')
+    pytest.EVENTS = os.path.join(datadir, 'event.c10')
+    pytest.ETHERNET = os.path.join(datadir, 'ethernet.c10')
+    pytest.ERR = os.path.join(datadir, 'err.c10')
+    pytest.BAD = os.path.join(datadir, 'bad.c10')
+    pytest.PCAP = os.path.join(datadir, 'test.pcap')
+    pytest.TMATS = os.path.join(datadir, 'test.tmt')
+
+
+def pytest_unconfigure():
+    shutil.rmtree(pytest.DATADIR, ignore_errors=True)
 
 
 class MockC10(C10):
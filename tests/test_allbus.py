@@ -4,8 +4,8 @@ from tempfile import NamedTemporaryFile
 from click.testing import CliRunner
 import pytest
 
-from c10_tools.allbus import allbus
-from c10_tools.common import C10
+from c10_tools.allbus import allbus, set_bus
+from c10_tools.common import C10, map_packets
 
 
 def test_overwrite(fake_progress):
@@ -36,3 +36,13 @@ def test_b(fake_progress):
         if packet.data_type == 0x19:
             for i, msg in enumerate(packet):
                 assert msg.bus == 1
+
+
+@pytest.mark.parametrize('bus', (0, 1))
+def test_set_bus(bus):
+    for packet in map_packets(pytest.SAMPLE):
+        if packet.data_type == 0x19:
+            decoded = packet.decode()
+            for msg in decoded:
+                msg.bus = bus
+            assert set_bus(packet, bus) == bytes(decoded)
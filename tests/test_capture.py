@@ -1,17 +1,38 @@
 
+from io import BytesIO
 from tempfile import NamedTemporaryFile
 import os
+import socket
+import threading
+import time
 
+import numpy as np
 import pytest
 from click.testing import CliRunner
 
-from c10_tools.capture import capture
+from c10_tools.capture import NetworkCapture, UDPReceiver, capture
+from c10_tools.common import map_packets
 
 
 def test_overwrite():
     path = NamedTemporaryFile('wb').name
     CliRunner().invoke(capture, [pytest.PCAP, path, '-f', '-t', pytest.TMATS])
-    assert os.stat(path).st_size == 7904
+    assert os.stat(path).st_size == 971800
+
+
+def test_segmented():
+    path = NamedTemporaryFile('wb').name
+    CliRunner().invoke(capture, [pytest.PCAP, path, '-f', '-t', pytest.TMATS])
+    checked = 0
+    for packet in map_packets(path):
+        if packet.flags & 3 != 3:
+            continue
+        raw = bytes(packet)
+        body = raw[36 if packet.flags & 0x80 else 24:-4]
+        total = int(np.frombuffer(body, '<u4').sum(dtype=np.uint64))
+        assert total & 0xffffffff == int.from_bytes(raw[-4:], 'little')
+        checked += 1
+    assert checked == 78
 
 
 def test_checks_exists():
@@ -26,4 +47,45 @@ def test_tmats():
     CliRunner().invoke(capture, [pytest.PCAP, path, '-f', '-t', pytest.TMATS])
     expected = open(pytest.TMATS, 'rb').read().replace(b'\r\n', b'\n')
     with open(path, 'rb') as f:
-        assert f.read(6351)[28:] == expected
\ No newline at end of file
+        assert f.read(6351)[28:] == expected
+
+def test_udp_queue_full():
+    receiver = UDPReceiver('127.0.0.1', 0, queue_size=2)
+    receiver.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for i in range(10):
+            sock.sendto(bytes([i]), ('127.0.0.1', receiver.port))
+        deadline = time.time() + 5
+        while receiver.dropped < 8 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        sock.close()
+        receiver.stop()
+    assert receiver.dropped == 8
+    assert [receiver.queue.get()[0] for _ in range(2)] == [b'\0', b'\1']
+
+
+def test_udp():
+    receiver = UDPReceiver('127.0.0.1', 0)
+    receiver.start()
+    packets = list(map_packets(pytest.SAMPLE))
+
+    def send():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for packet in packets:
+            sock.sendto(b'\0' * 4 + bytes(packet), ('127.0.0.1', receiver.port))
+            time.sleep(0.001)
+        sock.close()
+
+    sender = threading.Thread(target=send)
+    sender.start()
+    out = BytesIO()
+    try:
+        network, c10 = NetworkCapture(quiet=True).capture_udp(
+            receiver, out, duration=10, count=len(packets))
+    finally:
+        sender.join()
+        receiver.stop()
+    assert (network, c10) == (len(packets), len(packets))
+    assert out.getvalue() == open(pytest.SAMPLE, 'rb').read()
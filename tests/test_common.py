@@ -1,15 +1,17 @@
 
+from tempfile import NamedTemporaryFile
 from unittest.mock import Mock
 import os
 
+from click.testing import CliRunner
 import pytest
 
 from c10_tools import common
+from c10_tools.reindex import reindex
 
 
 def test_find_c10():
-    dirname = os.path.dirname(__file__)
-    result = common.find_c10([dirname])
+    result = common.find_c10([pytest.DATADIR])
     assert set(result) == set([
         pytest.ERR,
         pytest.SAMPLE,
@@ -57,3 +59,198 @@ def test_walk_packets_exclude_channel(c10):
 def test_walk_packets_include_type(c10):
     result = common.walk_packets(c10(packets), {'--type': '2'})
     assert list(result) == [packets[1]]
+
+
+def test_walk_headers():
+    with open(pytest.SAMPLE, 'rb') as f:
+        headers = list(common.walk_headers(f))
+    packets = list(common.C10(pytest.SAMPLE))
+    assert len(headers) == len(packets)
+    for header, packet in zip(headers, packets):
+        assert (header.channel_id, header.data_type, header.packet_length,
+                header.sequence_number, header.rtc) == \
+            (packet.channel_id, packet.data_type, packet.packet_length,
+             packet.sequence_number, packet.rtc)
+
+
+def test_walk_headers_truncated():
+    size = os.stat(pytest.ERR).st_size
+    with open(pytest.ERR, 'rb') as f:
+        headers = list(common.walk_headers(f, size))
+    assert sum(h.packet_length for h in headers) == 1046044
+
+
+def test_read_packet():
+    with open(pytest.SAMPLE, 'rb') as f:
+        header = list(common.walk_headers(f))[1]
+        packet = common.read_packet(f, header)
+    assert packet.data_type == 0x11
+    assert str(packet.time.time()) == '16:47:12'
+
+
+def test_read_index():
+    path = NamedTemporaryFile().name
+    CliRunner().invoke(reindex, [pytest.SAMPLE, path, '-f'])
+    with open(path, 'rb') as f:
+        index = common.read_index(f, os.stat(path).st_size)
+        assert len(index) == 95
+        for offset, channel_id, data_type, ipts in index[:5]:
+            f.seek(offset)
+            packet = next(common.C10(f))
+            assert (packet.channel_id, packet.data_type, packet.rtc) == \
+                (channel_id, data_type, ipts)
+
+
+def test_read_index_missing():
+    with open(pytest.SAMPLE, 'rb') as f:
+        assert common.read_index(f, os.stat(pytest.SAMPLE).st_size) is None
+
+
+@pytest.mark.parametrize('jobs', (2, 3, 8))
+def test_walk_range(jobs):
+    size = os.stat(pytest.ETHERNET).st_size
+    with open(pytest.ETHERNET, 'rb') as f:
+        expected = [h.offset for h in common.walk_headers(f, size)]
+        result = []
+        for start, end in common.split_file(size, jobs):
+            result += [h.offset for h in common.walk_range(f, start, end, size)]
+    assert result == expected
+
+
+def test_map_packets():
+    packets = list(common.map_packets(pytest.SAMPLE))
+    with open(pytest.SAMPLE, 'rb') as f:
+        headers = list(common.walk_headers(f))
+        assert [p.offset for p in packets] == [h.offset for h in headers]
+        for packet in packets[:10]:
+            f.seek(packet.offset)
+            assert bytes(packet) == f.read(packet.packet_length)
+
+
+def test_map_packets_truncated():
+    packets = list(common.map_packets(pytest.ERR))
+    assert sum(p.packet_length for p in packets) == 1046044
+
+
+def test_packet_view_decode():
+    packet = list(common.map_packets(pytest.SAMPLE))[2]
+    decoded = packet.decode()
+    assert decoded.data_type == packet.data_type == 0x19
+    assert len(packet.body) == packet.packet_length - 24
+    assert bytes(decoded) == bytes(packet)
+
+
+def test_packet_view_checksum():
+    packets = list(common.map_packets(pytest.SAMPLE))
+    assert {p.data_checksum for p in packets} > {0}
+    assert all(p.checksum_valid() for p in packets)
+    raw = bytearray(packets[-1].data)
+    raw[-1] ^= 1
+    assert not common.PacketView(memoryview(bytes(raw))).checksum_valid()
+
+
+@pytest.mark.parametrize('kernel_copy', (True, False))
+def test_packet_copier(kernel_copy):
+    packets = list(common.map_packets(pytest.SAMPLE))
+    with open(pytest.SAMPLE, 'rb') as f:
+        expected = f.read(packets[4].offset)
+    with NamedTemporaryFile() as out:
+        with common.PacketCopier(pytest.SAMPLE, out) as copier:
+            copier.kernel_copy = kernel_copy and copier.kernel_copy
+            for packet in packets[:2]:
+                copier.copy(packet.offset, packet.packet_length)
+            copier.write(bytes(packets[2]))
+            copier.copy(packets[3].offset, packets[3].packet_length)
+            assert copier.tell() == packets[4].offset
+        out.seek(0)
+        assert out.read() == expected
+
+
+def test_async_writer():
+    with open(pytest.SAMPLE, 'rb') as f:
+        expected = f.read()
+    path = NamedTemporaryFile().name
+    with common.AsyncWriter(path, buffer_size=4096) as out:
+        for i in range(0, len(expected), 1000):
+            out.write(expected[i:i + 1000])
+        assert out.tell() == len(expected)
+    with open(path, 'rb') as f:
+        assert f.read() == expected
+
+
+@pytest.mark.parametrize('kernel_copy', (True, False))
+def test_async_writer_copier(kernel_copy):
+    packets = list(common.map_packets(pytest.SAMPLE))
+    with open(pytest.SAMPLE, 'rb') as f:
+        expected = f.read()
+    path = NamedTemporaryFile().name
+    with common.AsyncWriter(path, buffer_size=4096) as out, \
+            common.PacketCopier(pytest.SAMPLE, out) as copier:
+        copier.kernel_copy = kernel_copy and copier.kernel_copy
+        for i, packet in enumerate(packets):
+            if i % 3:
+                copier.copy(packet.offset, packet.packet_length)
+            else:
+                copier.write(bytes(packet))
+        assert copier.tell() == len(expected)
+    with open(path, 'rb') as f:
+        assert f.read() == expected
+
+
+def test_async_writer_error(tmp_path, monkeypatch):
+    def write(fd, data):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(common.os, 'write', write)
+    with pytest.raises(OSError):
+        with common.AsyncWriter(str(tmp_path / 'out'), buffer_size=10) as out:
+            out.write(b'x' * 10)
+
+
+@pytest.mark.parametrize('buffer_size', (1000, 4096, 1 << 20))
+def test_prefetch_reader(buffer_size):
+    with open(pytest.SAMPLE, 'rb') as f:
+        expected = f.read()
+    with common.PrefetchReader(pytest.SAMPLE, buffer_size) as f:
+        assert f.read(100) == expected[:100]
+        for offset, size in ((50, 3000), (200000, 10), (10, 20),
+                             (len(expected) - 5, 100), (10 ** 7, 1)):
+            f.seek(offset)
+            assert f.read(size) == expected[offset:offset + size]
+        f.seek(-24, os.SEEK_END)
+        assert f.tell() == len(expected) - 24
+        f.seek(1000)
+        assert f.read() == expected[1000:]
+
+
+def test_open_reader(monkeypatch):
+    with common.open_reader(pytest.SAMPLE) as f:
+        assert isinstance(f, common.PrefetchReader)
+    monkeypatch.setattr(common.PrefetchReader, 'BUFFER_SIZE', 0)
+    with common.open_reader(pytest.SAMPLE) as f:
+        assert not isinstance(f, common.PrefetchReader)
+
+
+def test_walk_headers_errors():
+    errors = []
+    with open(pytest.BAD, 'rb') as f:
+        headers = list(common.walk_headers(f, os.stat(pytest.BAD).st_size,
+                                           lambda *args: errors.append(args)))
+    assert errors == [(9884, 'Incorrect sync pattern!')]
+    assert headers[3].offset == 24182
+
+
+def test_as_hex():
+    assert common.as_hex(b'\x00\x9e\xff') == '00 9e ff'
+    assert common.as_hex(b'') == ''
+
+
+def test_output_buffer(capsys):
+    output = common.OutputBuffer(batch_size=10)
+    output.write('abc')
+    assert capsys.readouterr().out == ''
+    output.write('defgh')
+    assert capsys.readouterr().out == 'abc\ndefgh\n'
+    output.write('i')
+    output.close()
+    assert capsys.readouterr().out == 'i\n'
@@ -7,7 +7,9 @@ from click.testing import CliRunner
 import pytest
 
 from c10_tools.copy import copy
+import c10_tools.copy as copy_module
 from c10_tools.common import C10
+from c10_tools.reindex import reindex
 
 
 def test_overwrite():
@@ -113,3 +115,29 @@ def test_slice_offset_rel():
     packets = list(C10(path))
     assert str(packets[0].time) == '2018-10-17 22:19:22'
     assert str(packets[-1].get_time()) == '2018-10-17 22:19:22.998157'
+
+
+def test_slice_indexed(monkeypatch):
+    indexed = NamedTemporaryFile().name
+    CliRunner().invoke(reindex, [pytest.ETHERNET, indexed, '-f'])
+
+    targets = []
+    index_seek = copy_module.index_seek
+
+    def spy(*args):
+        targets.append(index_seek(*args))
+        return targets[-1]
+
+    monkeypatch.setattr(copy_module, 'index_seek', spy)
+    results = []
+    for src in (pytest.ETHERNET, indexed):
+        path = NamedTemporaryFile().name
+        result = CliRunner().invoke(
+            copy, [src, path, '290:22:19:23', '0:01', '-f'])
+        assert result.exit_code == 0
+        results.append([(p.channel_id, p.rtc) for p in C10(path)
+                        if p.data_type != 0x3])
+    assert results[0]
+    assert results[0] == results[1]
+    # Only the reindexed file has an index to seek with.
+    assert targets and all(targets)
@@ -0,0 +1,88 @@
+from tempfile import NamedTemporaryFile
+import os
+
+from click.testing import CliRunner
+import numpy as np
+import pytest
+
+from c10_tools.common import C10, PacketView, map_packets, ms1553_offsets
+from c10_tools.extract import DTYPE, NpzWriter, concat, extract, \
+    extract_1553, read_messages
+
+
+@pytest.fixture
+def messages():
+    result = []
+    for packet in C10(pytest.ERR):
+        if packet.data_type == 0x19 and packet.channel_id == 2:
+            result += list(packet)
+    return result
+
+
+def test_extract_1553(messages):
+    columns = next(extract_1553(pytest.ERR, ['2'], chunk_size=10 ** 6))
+    assert len(columns['ipts']) == len(messages)
+    assert columns['ipts'].tolist() == [msg.ipts for msg in messages]
+    for name in ('le', 'se', 'we', 'bus', 'length'):
+        assert columns[name].tolist() == [getattr(msg, name)
+                                          for msg in messages]
+    for row, msg in zip(columns['words'], messages):
+        count = len(msg.data) // 2
+        assert row[:count].tobytes() == msg.data[:count * 2]
+        assert not row[count:].any()
+    assert (columns['command'] == columns['words'][:, 0]).all()
+
+
+def test_extract_1553_chunks(messages):
+    chunks = list(extract_1553(pytest.ERR, ['2'], chunk_size=100))
+    assert len(chunks) > 1
+    assert all(len(chunk['ipts']) >= 100 for chunk in chunks[:-1])
+    assert sum(len(chunk['ipts']) for chunk in chunks) == len(messages)
+
+
+def test_read_messages_rtc_wrap():
+    # Header RTC just before the 48-bit rollover, first message just after.
+    packet = next(p for p in map_packets(pytest.ERR) if p.data_type == 0x19)
+    data = bytearray(packet.data)
+    data[16:22] = ((1 << 48) - 10_000_000).to_bytes(6, 'little')
+    offset = ms1553_offsets(packet)[0]
+    data[offset:offset + 8] = (5_000_000).to_bytes(8, 'little')
+    columns = read_messages(PacketView(memoryview(data)), 100.0)
+    assert columns['time'][0] == 101.5
+
+
+def test_extract_1553_no_matches():
+    assert list(extract_1553(pytest.ERR, ['99'])) == []
+
+
+@pytest.mark.parametrize('ext', ('.npy', '.npz'))
+def test_extract(ext, messages):
+    path = NamedTemporaryFile(suffix=ext).name
+    try:
+        CliRunner().invoke(extract, [pytest.ERR, path, '-c', '2'],
+                           obj={'quiet': True})
+        data = np.load(path)
+        ipts = data['ipts']
+        if ext == '.npy':
+            assert data.dtype == DTYPE
+        assert ipts.tolist() == [msg.ipts for msg in messages]
+    finally:
+        os.remove(path)
+
+
+def test_extract_bad_extension():
+    result = CliRunner().invoke(extract, [pytest.ERR, 'out.txt'])
+    assert 'must end with' in result.stdout
+
+
+def test_npz_writer(tmp_path):
+    path = str(tmp_path / 'out.npz')
+    chunks = list(extract_1553(pytest.ERR, ['2'], chunk_size=100))
+    with NpzWriter(path) as out:
+        for chunk in chunks:
+            out.write(chunk)
+    data = np.load(path)
+    assert sorted(data.files) == sorted(DTYPE.names)
+    assert data['words'].shape == (out.count, 36)
+    assert (data['ipts'] == concat(chunks)['ipts']).all()
+    assert os.listdir(tmp_path) == ['out.npz']
@@ -2,7 +2,8 @@
 from click.testing import CliRunner
 import pytest
 
-from c10_tools.find import find
+from c10_tools.common import C10
+from c10_tools.find import find, match_1553, match_messages
 
 
 def test_find_simple():
@@ -77,4 +78,117 @@ def test_find_all():
     5e  343 16:47:12.654233 at 1025614
     16   at 1025912
     17   at 1026100
-    18   at 1026288''' in result.stdout
\ No newline at end of file
+    18   at 1026288''' in result.stdout
+
+def test_find_jobs():
+    args = ['*', '--cmd', '0x109e', '--offset', '2', pytest.SAMPLE, pytest.ERR]
+    expected = CliRunner().invoke(find, args).stdout
+    result = CliRunner().invoke(find, args + ['--jobs', '2'])
+    assert result.stdout == expected
+
+
+def test_find_jobs_single_file():
+    args = ['0x00', '--offset', '2', '--channel', '2', pytest.SAMPLE]
+    expected = CliRunner().invoke(find, args).stdout
+    result = CliRunner().invoke(find, args + ['--jobs', '4'])
+    assert result.stdout == expected
+
+
+@pytest.mark.parametrize('extra', ([], ['-l', '9'], ['--jobs', '3']))
+def test_find_rtc_wrap(extra):
+    # Message times in err.c10 need the 48-bit RTC wrap.
+    result = CliRunner().invoke(find, ['*', pytest.ERR] + extra)
+    assert result.exit_code == 0
+    if not extra:
+        assert '    46  314 21:48:52.169536 at 57088\n' in result.stdout
+
+
+@pytest.mark.parametrize('args', (
+    ('*', None, 2, 0, 0),
+    ({0}, None, 1, 2, 0),
+    ('*', {0x109e}, 2, 2, 0),
+    ({0xf}, None, 1, 2, 0x0f),
+    ('*', None, 8, 3, 0),
+    ({0, 0xfa, 0x5e}, {0x109e, 0x2060, 0x4062}, 1, 2, 0),
+))
+def test_match_1553(args):
+    for packet, copy in zip(C10(pytest.ERR), C10(pytest.ERR)):
+        if packet.data_type == 0x19:
+            assert list(match_1553(packet, *args)) == \
+                list(match_messages(copy, *args))
+
+
+def test_find_multiple_values():
+    single = [CliRunner().invoke(find, [value, '--offset', '2', '--channel', '2', pytest.SAMPLE]).stdout
+              for value in ('0x00', '0xfa')]
+    result = CliRunner().invoke(find, ['0x00,0xfa', '--offset', '2', '--channel', '2', pytest.SAMPLE])
+    assert result.stdout.startswith('Searching for 2 values in channel #2')
+    lines = [line for line in result.stdout.splitlines()
+             if line.startswith('    ')]
+    expected = [line for output in single for line in output.splitlines()
+                if line.startswith('    ')]
+    assert len(lines) == 23
+    assert sorted(lines, key=lambda l: int(l.split()[-1])) == \
+        sorted(expected, key=lambda l: int(l.split()[-1]))
+
+
+def test_find_values_file(tmp_path):
+    path = tmp_path / 'values.txt'
+    path.write_text('# Sentinels\n0x00\n0xfa  # command data\n')
+    result = CliRunner().invoke(find, [f'@{path}', '--offset', '2', '--channel', '2', pytest.SAMPLE])
+    expected = CliRunner().invoke(find, ['0x00,0xfa', '--offset', '2', '--channel', '2', pytest.SAMPLE])
+    assert result.stdout == expected.stdout
+
+
+def test_find_multiple_commands():
+    result = CliRunner().invoke(find, ['*', '--cmd', '0x109e', '--cmd', '0x1234', '--offset', '2', pytest.SAMPLE])
+    assert result.stdout == '''Searching for * with 2 command words at offset 2 in 1 files...
+
+  {}
+    fa  343 16:47:12.359556 at 136880 (command word 109e)
+    fa  343 16:47:12.484665 at 547570 (command word 109e)
+    fa  343 16:47:12.609754 at 901188 (command word 109e)
+
+finished\n'''.format(pytest.SAMPLE)
+
+
+def test_find_bytes():
+    result = CliRunner().invoke(find, ['--bytes', '8e 74 00 70 40 03', pytest.SAMPLE])
+    assert result.stdout == '''Searching for bytes 8e7400704003 in 1 files...
+
+  {}
+    8e7400704003  343 16:47:12.349478 at 6946 (channel 3, packet at 6716)
+    8e7400704003  343 16:47:12.399515 at 8952 (channel 3, packet at 6716)
+    8e7400704003  343 16:47:12.449518 at 401180 (channel 3, packet at 400316)
+    8e7400704003  343 16:47:12.499528 at 403330 (channel 3, packet at 400316)
+    8e7400704003  343 16:47:12.549541 at 721584 (channel 3, packet at 719908)
+
+finished\n'''.format(pytest.SAMPLE)
+
+
+def test_find_bytes_skips_headers():
+    result = CliRunner().invoke(find, ['--bytes', '25eb', pytest.EVENTS])
+    assert ' at ' not in result.stdout.split('files...')[1]
+
+
+def test_find_bytes_multiple():
+    result = CliRunner().invoke(find, ['--bytes', '0x8e740070,2e00', '-c', '3', pytest.SAMPLE])
+    lines = result.stdout.splitlines()
+    assert lines[0] == 'Searching for 2 byte patterns in channel #3 in 1 files...'
+    assert lines[3:5] == [
+        '    8e740070  343 16:47:12.349478 at 6946 (channel 3, packet at 6716)',
+        '    2e00  343 16:47:12.355743 at 7749 (channel 3, packet at 6716)']
+
+
+@pytest.mark.parametrize('value', ('zz', 'abc', '', ' , ', '0x'))
+def test_find_bytes_invalid(value):
+    result = CliRunner().invoke(find, ['--bytes', value, pytest.SAMPLE])
+    assert result.exit_code == 2
+    assert 'Invalid value for VALUE' in result.output
+
+
+def test_find_bytes_date_format():
+    # ethernet.c10 time packets use the month and year date format.
+    result = CliRunner().invoke(find, ['--bytes', '0800', pytest.ETHERNET])
+    line = result.stdout.splitlines()[3]
+    assert line.startswith('    0800  2018-10-17 22:19:')
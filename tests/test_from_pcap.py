@@ -1,10 +1,14 @@
 
+from io import BytesIO
 from tempfile import NamedTemporaryFile
 
+from chapter10 import C10
+from chapter10.message import MessageF0
 from click.testing import CliRunner
 import pytest
 
-from c10_tools.from_pcap import frompcap
+from c10_tools.common import map_packets
+from c10_tools.from_pcap import Packetizer, frompcap
 
 
 def test_checks_overwrite():
@@ -22,3 +26,69 @@ def test_tmats():
     path = NamedTemporaryFile().name
     CliRunner().invoke(frompcap, [pytest.PCAP, path, '-f', '-t', pytest.TMATS])
     assert open(path, 'rb').read(24) == b'%\xeb\x00\x00\xd0\x18\x00\x00\xb7\x18\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\xac\x1d'
+
+
+def headers(path):
+    return [(p.channel_id, p.data_type, p.sequence_number)
+            for p in map_packets(path)]
+
+
+def test_channel_by_port():
+    path = NamedTemporaryFile().name
+    CliRunner().invoke(frompcap, [pytest.PCAP, path, '-f', '-c', '2000=5',
+                                  '-s', '100000'])
+    assert [h for h in headers(path) if h[1] == 0x30] == [
+        (5, 0x30, i) for i in range(11)]
+    assert [h for h in headers(path) if h[1] == 0x11] == [
+        (0, 0x11, 0), (0, 0x11, 1)]
+
+
+def test_unmapped_port():
+    path = NamedTemporaryFile().name
+    CliRunner().invoke(frompcap, [pytest.PCAP, path, '-f', '-c', '2001=5'])
+    assert {h[1] for h in headers(path)} == {0x11}
+
+
+def test_max_latency():
+    path = NamedTemporaryFile().name
+    CliRunner().invoke(frompcap, [pytest.PCAP, path, '-f', '-l', '0.01'])
+    rtcs = [p.rtc for p in map_packets(path) if p.data_type == 0x30]
+    assert len(rtcs) == 14
+    for packet in C10(path):
+        if packet.data_type == 0x30:
+            ipts = [msg.ipts for msg in packet]
+            assert ipts[-1] - ipts[0] < 0.01 * 10_000_000
+
+
+def test_rtc_start():
+    path = NamedTemporaryFile().name
+    CliRunner().invoke(frompcap, [pytest.PCAP, path, '-f'])
+    packets = iter(C10(path))
+    time_packet, packet = next(packets), next(packets)
+    assert time_packet.data_type == 0x11 and time_packet.rtc == 0
+    # First message at 1492647300.277631.
+    assert next(iter(packet)).ipts == 2776310
+
+
+@pytest.mark.parametrize('size', ('0', '524289'))
+def test_max_size_range(size):
+    path = NamedTemporaryFile().name
+    result = CliRunner().invoke(frompcap, [pytest.PCAP, path, '-f', '-s', size])
+    assert result.exit_code == 2
+
+
+def test_packetizer():
+    out = BytesIO()
+    packetizer = Packetizer(7, out)
+    messages = [b'abc', b'defg', b'']
+    for i, data in enumerate(messages):
+        packetizer.add(i, 100 + i, data)
+    packetizer.flush()
+
+    expected = MessageF0(channel_id=7, data_type=0x30, count=3, rtc=100)
+    expected._messages = [
+        bytes(MessageF0.Message(ipts=100 + i, length=len(data), data=data))
+        for i, data in enumerate(messages)]
+    assert out.getvalue() == bytes(expected)
+    assert packetizer.sequence == 1
+    assert len(packetizer) == 4
@@ -29,8 +29,8 @@ def test_defaults_ascii():
 def test_error_csv():
     result = CliRunner(mix_stderr=False).invoke(inspect, [pytest.BAD, '-c', '1'], obj={'quiet': True})
     assert result.stdout == '''Channel,Type,Sequence,Size,Time,Valid,Offset
-1,17,110,36,343 16:47:12.000000,Yes,0
-"Type 0x5 not implemented at 36"
+1,17,110,36,343 16:47:12.000000,Yes,6680
+"Incorrect sync pattern! at 9,884"
 '''
 
 
@@ -42,10 +42,11 @@ def test_error_ascii():
 -----------------------------------------------------------------------------------------------
 |       0 |    1 |      182 |   6,680 | N/A                         | Yes   |               0 |
 |       1 |   17 |      110 |      36 | 343 16:47:12.000000         | Yes   |           6,680 |
+|       3 |   25 |      204 |   3,168 | 343 16:47:12.347833         | No    |           6,716 |
 {}
 |      14 |   64 |      196 |  15,636 | 343 16:47:12.254729         | Yes   |          24,182 |
 |      18 |   64 |      195 |  15,636 | 343 16:47:12.255114         | Yes   |          39,818 |'''.format(
-    colored('Packet length incorrect at 6,716', 'red'))
+    colored('Incorrect sync pattern! at 9,884', 'red'))
     assert expected in result.stdout
 
 
@@ -61,3 +62,16 @@ def test_inspect_filtering(type, expected):
     result = CliRunner(mix_stderr=True).invoke(inspect, [pytest.SAMPLE, '-t', type],
                                                obj={'quiet': True})
     assert len(result.stdout.splitlines()) == (expected + 3)
+
+
+def test_jobs():
+    expected = CliRunner(mix_stderr=False).invoke(
+        inspect, [pytest.SAMPLE], obj={'quiet': True}).stdout
+    result = CliRunner(mix_stderr=False).invoke(
+        inspect, [pytest.SAMPLE, '-j', '4'], obj={'quiet': True})
+    assert result.stdout == expected
+
+
+def test_truncated():
+    result = CliRunner(mix_stderr=False).invoke(inspect, [pytest.ERR], obj={'quiet': True})
+    assert result.stdout.endswith('"Packet truncated by end of file at 1,046,044"\n')
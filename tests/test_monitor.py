@@ -0,0 +1,139 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from c10_tools.common import PacketView, map_packets
+from c10_tools.monitor import ChannelHealth, RollingSum, StreamHealth, run
+from c10_tools.stream import udp_socket
+
+
+def test_rolling_sum():
+    total = RollingSum(count=3)
+    total.add(3, 0)
+    # At least one bucket wide before the window fills.
+    assert total.rate(0.5) == 3
+    for now in (0.5, 1.2, 2.9):
+        total.add(3, now)
+    assert total.rate(2.9) == 12 / 2.9
+    assert total.rate(3.1) == 2
+    assert total.rate(100) == 0
+
+
+def with_rtc(packet, rtc):
+    """Return a copy of PacketView "packet" with a different RTC."""
+
+    raw = bytearray(packet.data)
+    struct.pack_into('<IH', raw, 16, rtc & 0xffffffff, rtc >> 32)
+    struct.pack_into('<H', raw, 22,
+                     sum(PacketView.WORDS.unpack_from(raw)) & 0xffff)
+    return PacketView(memoryview(bytes(raw)))
+
+
+def test_channel_health():
+    packets = [p for p in map_packets(pytest.SAMPLE) if p.channel_id == 13]
+    assert packets[0].data_checksum
+    health = ChannelHealth(13, tolerance=0.05)
+    start = packets[0].rtc
+    for i, packet in enumerate(packets):
+        now = (packet.rtc - start) / 10_000_000
+        if i == 2:
+            continue
+        if i == 4:
+            packet = with_rtc(packet, start - 1)
+        if i == 5:
+            data = bytearray(packet.data)
+            data[40] ^= 1
+            packet = PacketView(memoryview(bytes(data)))
+        health.add(packet, now)
+    assert health.packets == len(packets) - 1
+    assert (health.sequence_errors, health.missing) == (1, 1)
+    assert health.rtc_jumps == 2
+    assert health.checksum_errors == 1
+
+
+def test_channel_health_late():
+    packets = [p for p in map_packets(pytest.SAMPLE) if p.channel_id == 13]
+    health = ChannelHealth(13)
+    start = packets[0].rtc
+    for i in (0, 1, 1, 3, 2, 4):
+        health.add(packets[i], (packets[i].rtc - start) / 10_000_000)
+    assert (health.sequence_errors, health.missing) == (1, 1)
+    assert health.late == 2
+    assert health.rtc_jumps == 0
+
+
+def test_run():
+    sock = udp_socket('127.0.0.1', 0)
+    sock.setblocking(False)
+    port = sock.getsockname()[1]
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    http = probe.getsockname()
+    probe.close()
+    packets = list(map_packets(pytest.SAMPLE))
+    health = StreamHealth()
+    summaries = []
+
+    async def send():
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for packet in packets:
+            sender.sendto(b'\0' * 4 + bytes(packet), ('127.0.0.1', port))
+            await asyncio.sleep(0.001)
+        sender.close()
+
+        reader, writer = await asyncio.open_connection(*http)
+        writer.write(b'GET /metrics HTTP/1.0\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    async def main():
+        task = asyncio.ensure_future(send())
+        await run(sock, health, 0.5, http, 1.0, {12, 13},
+                  summaries.append)
+        return await task
+
+    response = asyncio.run(main())
+    sock.close()
+
+    assert response.startswith('HTTP/1.0 200 OK')
+    assert 'c10_packets_total{channel="12"} 6\n' in response
+    assert 'c10_packets_total{channel="13"} 8\n' in response
+    assert 'c10_missing_total{channel="13"} 0\n' in response
+    assert 'channel="14"' not in response
+    assert summaries and 'Channel 13' in summaries[-1]
+
+
+def test_run_transfer():
+    sock = udp_socket('127.0.0.1', 0)
+    sock.setblocking(False)
+    port = sock.getsockname()[1]
+
+    # A short stream with format 1 transfer headers is held for reordering
+    # until it goes quiet, but each packet keeps its own arrival time.
+    packets = [p for p in map_packets(pytest.SAMPLE) if p.channel_id == 13]
+    start = packets[0].rtc
+    packets = [with_rtc(p, start + i * 600_000) for i, p in enumerate(packets)]
+    health = StreamHealth(tolerance=0.02)
+
+    async def send():
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for i, packet in enumerate(packets):
+            sender.sendto(b'\x01' + i.to_bytes(3, 'little') + bytes(packet),
+                          ('127.0.0.1', port))
+            await asyncio.sleep(0.06)
+        sender.close()
+
+    async def main():
+        task = asyncio.ensure_future(send())
+        await run(sock, health, 0, None, 1.0)
+        await task
+
+    asyncio.run(main())
+    sock.close()
+
+    channel = health.channels[13]
+    assert channel.packets == len(packets)
+    assert channel.rtc_jumps == 0
@@ -0,0 +1,85 @@
+from tempfile import NamedTemporaryFile
+import struct
+
+from click.testing import CliRunner
+import dpkt
+import pytest
+
+from c10_tools.from_pcap import frompcap
+from c10_tools.pcap import PcapReader
+
+
+def dpkt_payloads(path):
+    with open(path, 'rb') as f:
+        for timestamp, frame in dpkt.pcap.Reader(f):
+            udp = dpkt.ethernet.Ethernet(frame).data.data
+            yield timestamp, udp.sport, udp.dport, bytes(udp.data)
+
+
+def write_pcapng(frames):
+    """Write (timestamp, frame) pairs to a temporary pcapng file with
+    nanosecond timestamps.
+    """
+
+    def block(block_type, body):
+        body += b'\0' * (-len(body) % 4)
+        length = len(body) + 12
+        return struct.pack('<II', block_type, length) + body + \
+            struct.pack('<I', length)
+
+    f = NamedTemporaryFile(suffix='.pcapng')
+    f.write(block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1)))
+    f.write(block(1, struct.pack('<HHI', 1, 0, 0) + struct.pack(
+        '<HHB3xHH', 9, 1, 9, 0, 0)))
+    for timestamp, frame in frames:
+        ns = int(round(timestamp * 1e9))
+        f.write(block(6, struct.pack(
+            '<IIIII', 0, ns >> 32, ns & 0xffffffff, len(frame),
+            len(frame)) + frame))
+    f.flush()
+    return f
+
+
+def test_pcap():
+    with open(pytest.PCAP, 'rb') as f:
+        assert list(PcapReader(f)) == list(dpkt_payloads(pytest.PCAP))
+
+
+def test_pcapng():
+    with open(pytest.PCAP, 'rb') as f:
+        frames = [(ts, bytes(frame)) for ts, frame in dpkt.pcap.Reader(f)]
+    with write_pcapng(frames) as f:
+        result = list(PcapReader(f))
+    expected = list(dpkt_payloads(pytest.PCAP))
+    assert [r[1:] for r in result] == [e[1:] for e in expected]
+    assert [r[0] for r in result] == pytest.approx([e[0] for e in expected])
+
+
+def test_ports():
+    with open(pytest.PCAP, 'rb') as f:
+        assert len(list(PcapReader(f, {2000}))) == 1021
+        assert list(PcapReader(f, {2001})) == []
+
+
+UDP = dpkt.udp.UDP(sport=1, dport=2000, ulen=15, data=b'payload')
+
+
+@pytest.mark.parametrize('frame', (
+    # VLAN tag (decoded by dpkt)
+    bytes(dpkt.ethernet.Ethernet(
+        vlan_tags=[dpkt.ethernet.VLANtag8021Q(id=5)],
+        data=dpkt.ip.IP(p=17, data=UDP))),
+    # Padded to the minimum Ethernet frame size
+    bytes(dpkt.ethernet.Ethernet(data=dpkt.ip.IP(p=17, data=UDP))) +
+    b'\0' * 10,
+))
+def test_frames(frame):
+    with write_pcapng([(0, frame)]) as f:
+        assert list(PcapReader(f)) == [(0, 1, 2000, b'payload')]
+
+
+def test_frompcap_ports():
+    path = NamedTemporaryFile().name
+    CliRunner().invoke(frompcap, [pytest.PCAP, path, '-f', '-p', '2001'])
+    with open(path, 'rb') as f:
+        assert f.read() == b''
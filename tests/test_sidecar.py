@@ -0,0 +1,75 @@
+from tempfile import TemporaryDirectory
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from c10_tools.common import C10, walk_packets
+from c10_tools.sidecar import Sidecar
+
+
+@pytest.fixture
+def sample():
+    with TemporaryDirectory() as dirname:
+        path = os.path.join(dirname, 'sample.c10')
+        shutil.copy(pytest.SAMPLE, path)
+        yield path
+
+
+def test_build(sample):
+    index = Sidecar.build(sample)
+    packets = list(C10(sample))
+    assert len(index) == len(packets)
+    assert index.channel_id.tolist() == [p.channel_id for p in packets]
+    assert index.data_type.tolist() == [p.data_type for p in packets]
+    assert index.rtc.tolist() == [p.rtc for p in packets]
+    assert index.offset[-1] + index.packet_length[-1] == \
+        os.stat(sample).st_size
+    assert str(index.get_time(1)) == str(packets[1].time)
+
+
+def test_load_saves(sample):
+    index = Sidecar.load(sample)
+    assert os.path.exists(sample + Sidecar.EXTENSION)
+    cached = Sidecar.load(sample, build=False)
+    assert cached.offset.tolist() == index.offset.tolist()
+    assert np.array_equal(cached.time, index.time, equal_nan=True)
+
+
+def test_load_stale(sample):
+    Sidecar.load(sample)
+    with open(sample, 'ab') as f:
+        f.write(b'\0' * 4)
+    assert Sidecar.load(sample, build=False) is None
+
+
+@pytest.mark.parametrize('args', (
+    {'--channel': '2,3'},
+    {'--exclude': '13'},
+    {'--type': '0x19'},
+))
+def test_walk(sample, args):
+    expected = [(p.channel_id, p.rtc)
+                for p in walk_packets(C10(sample), dict(args))]
+    result = [(p.channel_id, p.rtc)
+              for p in walk_packets(C10(sample), dict(args), sidecar=True)]
+    assert result == expected
+    assert os.path.exists(sample + Sidecar.EXTENSION)
+
+
+def test_no_save(sample, monkeypatch):
+    monkeypatch.setattr(Sidecar, 'SAVE', False)
+    assert len(Sidecar.load(sample)) == 95
+    assert not os.path.exists(sample + Sidecar.EXTENSION)
+
+
+def test_bad_time_packet(sample):
+    # Overwrite the time packet's BCD digits with invalid values.
+    with open(sample, 'r+b') as f:
+        f.seek(6680 + 28)
+        f.write(b'\xff' * 8)
+    index = Sidecar.load(sample)
+    assert index.time_errors == 1
+    assert np.isnan(index.time).all()
+    assert not os.path.exists(sample + Sidecar.EXTENSION)
@@ -129,3 +129,24 @@ Summary for {}:
     Size:                308  b     Duration:                          0
 
 '''.format(os.path.abspath(pytest.EVENTS)).lstrip()
+
+
+def test_jobs():
+    result = CliRunner().invoke(stat, [pytest.SAMPLE, pytest.SAMPLE, '-j', '2'],
+                                obj={'quiet': True})
+    assert result.stdout.strip() == '\n\n'.join([expected, expected])
+
+
+def test_verbose_jobs():
+    expected = CliRunner().invoke(stat, [pytest.ERR, '-c', '2'],
+                                  obj={'verbose': True, 'quiet': True})
+    result = CliRunner().invoke(stat, [pytest.ERR, '-c', '2', '-j', '4'],
+                                obj={'verbose': True, 'quiet': True})
+    assert result.stdout == expected.stdout
+
+
+def test_verbose_empty_1553_message():
+    result = CliRunner().invoke(stat, [pytest.BAD, '-c', '2'],
+                                obj={'verbose': True, 'quiet': True})
+    assert 'Failed' not in result.stdout
+    assert 'Command words (21):' in result.stdout
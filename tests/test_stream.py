@@ -0,0 +1,114 @@
+import struct
+
+import pytest
+
+from c10_tools.common import map_packets
+from c10_tools.stream import StreamParser, TransferDecoder, TransferDemux
+
+
+@pytest.mark.parametrize('chunk_size', (1, 1000, 100000))
+def test_stream_parser(chunk_size):
+    with open(pytest.SAMPLE, 'rb') as f:
+        data = b'\x25\xeb garbage' + f.read()
+    parser = StreamParser()
+    packets = []
+    for i in range(0, len(data), chunk_size):
+        packets += parser.feed(data[i:i + chunk_size])
+    expected = list(map_packets(pytest.SAMPLE))
+    assert [bytes(p) for p in packets] == [bytes(p) for p in expected]
+    assert parser.skipped == 10
+    assert len(parser.buf) < 24
+
+
+def transfer_datagrams(packets, size=1000):
+    """Wrap packets in format 1 UDP transfer headers, segmenting any that
+    don't fit in one datagram.
+    """
+
+    datagrams = []
+    for packet in packets:
+        data = bytes(packet)
+        seq = len(datagrams).to_bytes(3, 'little')
+        if len(data) + 4 <= size:
+            datagrams.append(b'\x01' + seq + data)
+            continue
+        for offset in range(0, len(data), size - 12):
+            seq = len(datagrams).to_bytes(3, 'little')
+            datagrams.append(
+                b'\x11' + seq + struct.pack(
+                    '<HBxI', packet.channel_id, packet.sequence_number,
+                    offset) + data[offset:offset + size - 12])
+    return datagrams
+
+
+def test_transfer_decoder():
+    packets = list(map_packets(pytest.SAMPLE))
+    datagrams = transfer_datagrams(packets)
+
+    # Swap neighbours so every other datagram arrives early.
+    for i in range(0, len(datagrams) - 1, 2):
+        datagrams[i], datagrams[i + 1] = datagrams[i + 1], datagrams[i]
+    decoder = TransferDecoder(window=4)
+    out = []
+    for datagram in datagrams + datagrams[:1]:
+        out += decoder.feed(datagram)
+    out += decoder.flush()
+    assert b''.join(data for data, _ in out) == \
+        b''.join(bytes(p) for p in packets)
+    assert (decoder.lost, decoder.late, decoder.incomplete) == (0, 1, 0)
+
+
+def test_transfer_decoder_lost():
+    packets = list(map_packets(pytest.SAMPLE))
+    datagrams = transfer_datagrams(packets)
+    segmented = [i for i, d in enumerate(datagrams) if d[0] == 0x11]
+
+    # Drop the second segment of the first segmented packet.
+    del datagrams[segmented[1]]
+    decoder = TransferDecoder(window=4)
+    out = []
+    for datagram in datagrams:
+        out += decoder.feed(datagram)
+    out += decoder.flush()
+    assert decoder.lost == 1
+    assert decoder.incomplete == 1
+    assert len(out) == len(packets) - 1
+
+
+def test_transfer_decoder_arrival():
+    packets = list(map_packets(pytest.SAMPLE))
+    datagrams = transfer_datagrams(packets)
+    decoder = TransferDecoder(window=4)
+    out = []
+    for i, datagram in enumerate(datagrams):
+        out += decoder.feed(datagram, i)
+    out += decoder.flush()
+
+    # Each packet keeps the arrival time of its own (last) datagram rather
+    # than that of whichever datagram released it.
+    last = [i for i, d in enumerate(datagrams)
+            if i + 1 == len(datagrams) or datagrams[i + 1][0] == 1 or
+            int.from_bytes(datagrams[i + 1][8:12], 'little') == 0]
+    assert [arrival for _, arrival in out] == last
+
+
+def test_transfer_demux():
+    packets = list(map_packets(pytest.SAMPLE))
+    datagrams = transfer_datagrams(packets)
+
+    # Two recorders with overlapping sequence numbers, plus a stray datagram
+    # from somewhere else that looks like a transfer header.
+    demux = TransferDemux(window=4)
+    out = {'a': [], 'b': [], 'c': []}
+    for i, datagram in enumerate(datagrams):
+        for source in ('a', 'b'):
+            out[source] += demux.feed(datagram, source=source)
+        if i == 10:
+            out['c'] += demux.feed(b'\x01\xff\xff\x00junk', source='c')
+    for source, decoder in demux.decoders.items():
+        out[source] += decoder.flush()
+
+    expected = b''.join(bytes(p) for p in packets)
+    for source in ('a', 'b'):
+        assert b''.join(data for data, _ in out[source]) == expected
+    assert (demux.lost, demux.late, demux.incomplete) == (0, 0, 0)
@@ -0,0 +1,76 @@
+from io import StringIO
+import asyncio
+import socket
+
+import pytest
+
+from c10_tools.common import map_packets
+from c10_tools.stream import udp_socket
+from c10_tools.streamcheck import RateBins, TextRenderer, monitor
+
+
+def test_rate_bins():
+    bins = RateBins(0.5, count=3)
+    bins.add(1, 100, 10.0)
+    bins.add(2, 50, 10.2)
+    bins.add(1, 100, 10.6)
+    assert bins.closed() == [(0.5, {1: 200.0, 2: 100.0})]
+    bins.roll(11.2)
+    assert bins.closed() == [(1.0, {1: 200.0})]
+    assert bins.closed() == []
+
+    # Long gaps don't have to be filled in.
+    bins.roll(1000)
+    assert len(bins.history) == 3
+    assert bins.channels == {1, 2}
+
+
+def test_csv():
+    out = StringIO()
+    renderer = TextRenderer(csv=True, out=out)
+    renderer.update(None, [(1.0, {3: 10.0, 1: 5.0})])
+    assert out.getvalue() == (
+        'time,channel_id,bytes_per_second\n1.000,1,5.0\n1.000,3,10.0\n')
+
+
+def test_text_renderer_stdout(capsys):
+    TextRenderer(csv=True).update(None, [(1.0, {2: 4.0})])
+    assert capsys.readouterr().out == \
+        'time,channel_id,bytes_per_second\n1.000,2,4.0\n'
+
+
+@pytest.mark.parametrize('transfer', (0, 1))
+def test_monitor(transfer):
+    sock = udp_socket('localhost', 0)
+    sock.setblocking(False)
+    port = sock.getsockname()[1]
+    packets = list(map_packets(pytest.SAMPLE))[:40]
+    expected = sum(p.data_length for p in packets if p.channel_id == 12)
+    assert expected
+
+    async def send():
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for i, packet in enumerate(packets):
+
+            # Format 1 transfer headers have a sequence number. Fewer
+            # datagrams than the reorder window are only released once the
+            # stream goes quiet.
+            header = bytes([transfer]) + i.to_bytes(3, 'little')
+            sender.sendto(header + bytes(packet), ('127.0.0.1', port))
+            await asyncio.sleep(0.001)
+        sender.close()
+
+    async def run():
+        task = asyncio.ensure_future(send())
+        await monitor(sock, bins, renderer, {12}, fps=20, duration=1.0)
+        await task
+
+    bins = RateBins(0.25)
+    out = StringIO()
+    renderer = TextRenderer(csv=True, out=out)
+    asyncio.run(run())
+    sock.close()
+
+    rows = [line.split(',') for line in out.getvalue().splitlines()[1:]]
+    assert {row[1] for row in rows} == {'12'}
+    assert sum(float(row[2]) for row in rows) * 0.25 == expected
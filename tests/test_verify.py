@@ -0,0 +1,52 @@
+
+from click.testing import CliRunner
+import pytest
+
+from c10_tools.verify import verify, Verify
+
+
+def test_ok():
+    result = CliRunner().invoke(verify, [pytest.SAMPLE], obj={'quiet': True})
+    assert result.exit_code == 0
+    assert result.stdout.strip().endswith('OK')
+
+
+def test_checksum_and_skipped():
+    result = Verify(pytest.BAD, detail=True).run()
+    assert result.channels[3].checksum_errors == 1
+    assert result.skipped == 14298
+    assert result.problems == 2
+    assert (6716, 3, 'Data checksum mismatch') in result.issues
+    assert (9884, None, 'Skipped 14,298 bytes') in result.issues
+
+
+def test_skim():
+    result = Verify(pytest.BAD, checksums=False).run()
+    assert not any(c.checksum_errors for c in result.channels.values())
+    assert result.problems == 1
+
+
+def test_truncated():
+    result = Verify(pytest.ERR).run()
+    assert result.truncated == 2532
+    assert 'Truncated final packet (2,532 bytes)' in result.report()
+
+
+def test_sequence_gaps():
+    result = Verify(pytest.EVENTS, detail=True).run()
+    assert result.channels[0].gaps == 6
+    assert result.issues[0] == (44, 0, 'Sequence 80 after 65')
+
+
+def test_index_rtc():
+    # Index packets refer back to earlier RTCs.
+    result = Verify(pytest.ETHERNET).run()
+    assert result.problems == 0
+
+
+def test_exit_status():
+    result = CliRunner().invoke(verify, [pytest.SAMPLE, pytest.BAD, '-j', '2'],
+                                obj={'quiet': True, 'verbose': True})
+    assert result.exit_code == 1
+    assert 'channel 3 Data checksum mismatch' in result.stdout
+    assert result.stdout.count('Verifying') == 2